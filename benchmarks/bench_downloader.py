@@ -0,0 +1,168 @@
+"""
+下载器吞吐压测：启动本地模拟 Danbooru (mock_danbooru.py)，分别跑两个下载器(同一个引擎的两份配置)，
+统计 帖子/秒、MB/秒、峰值内存、CPU时间。下载器在子进程里运行，CPU和内存只算下载器自己的。
+
+例子:
+    python benchmarks/bench_downloader.py --posts 400 --lines 8 --max-images 40 --latency 0.05 --bandwidth 4000000
+    python benchmarks/bench_downloader.py --downloader main --throttle-rate 0.05 --max-rps 30
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+from mock_danbooru import add_server_arguments, build_corpus, server_options, start_server
+
+DOWNLOADERS = {
+    'main': 'downloader_for_lora_train',
+    'basic': 'downloader_for_lora_train_basic',
+}
+
+def resource_usage():
+    """返回 (用户态CPU秒, 内核态CPU秒, 峰值内存MB)，没有 resource 模块(Windows)时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # Linux 上 ru_maxrss 单位是KB，macOS 上是字节
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return usage.ru_utime, usage.ru_stime, usage.ru_maxrss / divisor
+
+def run_worker(args):
+    """子进程：把下载器的 API_BASE 指向模拟服务器，按脚本自己的方式跑完(出错会从出错行重启)"""
+    import downloader_engine
+    module = importlib.import_module(DOWNLOADERS[args.worker])
+    downloader_engine.API_BASE = args.api_base
+    kwargs = dict(txt_path=args.tags_file, save_dir=args.save_dir, timeout=60, proxies=None,
+                  max_images=args.max_images, min_side=args.min_side, host_rates={},
+                  # 不用HTTP缓存：否则后跑的下载器直接用前一个缓存的列表，对比就不公平了，也不会在仓库里留下缓存文件
+                  http_cache_path=None)
+    if args.worker == 'main':
+        # basic 用它自己的保守并发配置，这些参数只对 main 生效
+        kwargs.update(max_lines_per_batch=args.max_lines_per_batch,
+                      max_concurrent_posts=args.max_concurrent_posts, max_in_flight=args.max_in_flight,
+                      max_per_host=args.max_per_host, convert_workers=args.convert_workers)
+    start_line = 1
+    restarts = 0
+    while True:
+        result = asyncio.run(module.main(start_line=start_line, **kwargs))
+        if result is None or restarts >= args.max_restarts:
+            break
+        start_line = result
+        restarts += 1
+        kwargs['resume'] = True
+    usage = resource_usage()
+    with open(args.result_file, 'w', encoding='utf-8') as f:
+        json.dump({'restarts': restarts, 'usage': usage}, f)
+
+def bench_one(name, args, server):
+    from download_manifest import DownloadManifest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        tags_file = tmp / 'tags.txt'
+        tags_file.write_text('\n'.join(f"tag_{i}" for i in range(args.lines)) + '\n', encoding='utf-8')
+        save_dir = tmp / 'out'
+        result_file = tmp / 'result.json'
+        cmd = [sys.executable, __file__, '--worker', name, '--api-base', server.base_url,
+               '--tags-file', str(tags_file), '--save-dir', str(save_dir), '--result-file', str(result_file),
+               '--max-images', str(args.max_images), '--max-lines-per-batch', str(args.max_lines_per_batch),
+               '--max-concurrent-posts', str(args.max_concurrent_posts), '--max-in-flight', str(args.max_in_flight),
+               '--max-per-host', str(args.max_per_host), '--max-restarts', str(args.max_restarts)]
+        if args.min_side:
+            cmd += ['--min-side', str(args.min_side)]
+        if args.convert_workers:
+            cmd += ['--convert-workers', str(args.convert_workers)]
+
+        before = dict(server.stats)
+        started = time.perf_counter()
+        # 下载器每个文件都会打印，默认丢掉 stdout，报错仍然显示
+        subprocess.run(cmd, check=True, stdout=None if args.verbose else subprocess.DEVNULL)
+        elapsed = time.perf_counter() - started
+        stats = {key: server.stats[key] - before[key] for key in before}
+
+        with DownloadManifest(save_dir) as manifest:
+            posts = len(manifest)
+        worker = json.loads(result_file.read_text(encoding='utf-8'))
+
+    usage = worker['usage']
+    return {
+        'downloader': name,
+        'seconds': elapsed,
+        'posts': posts,
+        'posts_per_s': posts / elapsed,
+        'mb_per_s': stats['media_bytes'] / elapsed / 1e6,
+        'cpu_s': usage[0] + usage[1] if usage else None,
+        'peak_rss_mb': usage[2] if usage else None,
+        'restarts': worker['restarts'],
+        'server': stats,
+    }
+
+def print_report(results):
+    print(f"\n{'下载器':<8}{'用时(s)':>10}{'帖子':>8}{'帖子/s':>10}{'MB/s':>10}{'CPU(s)':>10}{'峰值内存(MB)':>14}{'重启':>6}")
+    for r in results:
+        cpu = f"{r['cpu_s']:.2f}" if r['cpu_s'] is not None else '-'
+        rss = f"{r['peak_rss_mb']:.1f}" if r['peak_rss_mb'] is not None else '-'
+        print(f"{r['downloader']:<8}{r['seconds']:>10.2f}{r['posts']:>8}{r['posts_per_s']:>10.2f}"
+              f"{r['mb_per_s']:>10.2f}{cpu:>10}{rss:>14}{r['restarts']:>6}")
+    for r in results:
+        s = r['server']
+        print(f"  {r['downloader']}: 请求 {s['requests']} (列表 {s['listing']}, 媒体 {s['media']}), "
+              f"注入错误 {s['errors']}, 注入429 {s['throttled']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='下载器离线吞吐压测')
+    add_server_arguments(parser)
+    parser.add_argument('--downloader', choices=['main', 'basic', 'both'], default='both')
+    parser.add_argument('--lines', type=int, default=6, help='标签行数 (tag_0 ... tag_{lines-1})')
+    parser.add_argument('--max-images', type=int, default=30, help='每行最多下载数')
+    parser.add_argument('--max-lines-per-batch', type=int, default=5)
+    parser.add_argument('--max-concurrent-posts', type=int, default=4)
+    parser.add_argument('--max-in-flight', type=int, default=16)
+    parser.add_argument('--max-per-host', type=int, default=8)
+    parser.add_argument('--convert-workers', type=int, default=None)
+    parser.add_argument('--min-side', type=int, default=None, help='设置后下载满足短边的最小版本')
+    parser.add_argument('--max-restarts', type=int, default=20, help='出错后最多从出错行重启几次')
+    parser.add_argument('--json', help='结果另存为JSON')
+    parser.add_argument('--verbose', action='store_true', help='显示下载器自己的输出')
+    # 子进程参数
+    parser.add_argument('--worker', choices=list(DOWNLOADERS), help=argparse.SUPPRESS)
+    parser.add_argument('--api-base', help=argparse.SUPPRESS)
+    parser.add_argument('--tags-file', help=argparse.SUPPRESS)
+    parser.add_argument('--save-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    print(f"生成合成数据: {args.posts} 个帖子, {args.tags} 种标签...")
+    server = start_server(build_corpus(args), **server_options(args))
+    print(f"模拟服务器: {server.base_url}")
+    names = list(DOWNLOADERS) if args.downloader == 'both' else [args.downloader]
+    results = []
+    try:
+        for name in names:
+            print(f"运行 {name} 下载器...")
+            results.append(bench_one(name, args, server))
+    finally:
+        with contextlib.suppress(Exception):
+            server.shutdown()
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+缩小解码算哈希的压测：同一批图片分别完整解码和按缩小尺寸解码(phash_dedup.load_for_hash)算感知哈希，
+统计每张图的平均用时，以及两种方式得到的哈希相差多少位。
+
+默认生成合成的大图(渐变 + 色块 + 噪声，接近照片/插画的频率分布)，也可以用 --dir 指向真实的图片文件夹。
+
+例子:
+    python benchmarks/bench_phash_decode.py
+    python benchmarks/bench_phash_decode.py --count 20 --width 4000 --height 6000 --formats jpg png webp
+    python benchmarks/bench_phash_decode.py --dir downloaded_images1/.store --hash-size 16
+
+单核上 8 张 4000x6000 合成图片的结果（64位哈希）:
+    格式    完整解码    缩小解码    加速   哈希相同   平均差   最大差
+    jpg     326ms      48ms     6.8x     88%     0.25      2
+    png     760ms     641ms     1.2x     88%     0.25      2
+    webp    693ms     562ms     1.2x    100%     0.00      0
+JPEG 的解码器可以直接按 1/8 解码，快得最多；PNG/WebP 只能完整解码，省下的是缩小的时间。
+相差 1~2 位远小于常用的阈值(5左右)，查重结果基本不变。
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from phash_dedup import image_phash
+
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
+
+def synthetic_image(width, height, rng):
+    """渐变底色 + 随机色块 + 少量噪声"""
+    small = Image.linear_gradient('L').resize((width // 8, height // 8)).convert('RGB')
+    draw = ImageDraw.Draw(small)
+    for _ in range(rng.randint(5, 20)):
+        x, y = rng.randrange(small.width), rng.randrange(small.height)
+        r = rng.randint(small.width // 20, small.width // 4)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)((x - r, y - r, x + r, y + r), fill=color)
+    img = small.filter(ImageFilter.GaussianBlur(2)).resize((width, height), Image.BICUBIC)
+    noise = Image.effect_noise((width, height), 12).convert('RGB')
+    return Image.blend(img, noise, 0.15)
+
+def make_images(directory, count, width, height, formats, seed=0):
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        img = synthetic_image(width, height, rng)
+        for ext in formats:
+            path = Path(directory) / f"{i:03d}.{ext}"
+            params = {'quality': 92} if ext in ('jpg', 'webp') else {}
+            img.save(path, **params)
+            paths.append(path)
+    return paths
+
+def measure(paths, hash_size, repeat):
+    """返回 {扩展名: [(完整解码秒, 缩小解码秒, 哈希相差位数), ...]}"""
+    results = {}
+    for path in paths:
+        timings = {}
+        hashes = {}
+        for reduced in (False, True):
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                image_hash, _, _, error = image_phash(path, hash_size=hash_size, reduced=reduced)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            if image_hash is None:
+                print(f"无法处理图片 {path}: {error}")
+                break
+            timings[reduced] = best
+            hashes[reduced] = image_hash
+        if len(hashes) < 2:
+            continue
+        ext = path.suffix.lower().lstrip('.')
+        results.setdefault(ext, []).append((timings[False], timings[True], int(hashes[False] - hashes[True])))
+    return results
+
+def print_report(results, hash_size):
+    bits = hash_size * hash_size
+    print(f"\n哈希 {bits} 位，每张取多次中最快的一次:")
+    print(f"{'格式':>6} {'张数':>5} {'完整解码':>10} {'缩小解码':>10} {'加速':>6} {'相同':>6} {'平均差':>6} {'最大差':>6}")
+    for ext, rows in sorted(results.items()):
+        full = statistics.mean(row[0] for row in rows)
+        reduced = statistics.mean(row[1] for row in rows)
+        distances = [row[2] for row in rows]
+        same = sum(1 for d in distances if d == 0) / len(distances)
+        print(f"{ext:>6} {len(rows):>5} {full * 1000:>8.1f}ms {reduced * 1000:>8.1f}ms {full / reduced:>5.1f}x "
+              f"{same:>6.0%} {statistics.mean(distances):>6.2f} {max(distances):>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description='缩小解码算感知哈希的用时和误差')
+    parser.add_argument('--dir', help='用这个文件夹里的图片，不生成合成图片')
+    parser.add_argument('--limit', type=int, default=200, help='--dir 时最多取多少张')
+    parser.add_argument('--count', type=int, default=10, help='每种格式生成多少张')
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=6000)
+    parser.add_argument('--formats', nargs='+', default=['jpg', 'png', 'webp'])
+    parser.add_argument('--hash-size', type=int, default=8, choices=[8, 16])
+    parser.add_argument('--repeat', type=int, default=2)
+    args = parser.parse_args()
+
+    if args.dir:
+        paths = sorted(p for p in Path(args.dir).iterdir() if p.suffix.lower() in IMAGE_EXTS)[:args.limit]
+        results = measure(paths, args.hash_size, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(f"生成合成图片: {args.count} 张 x {len(args.formats)} 种格式, {args.width}x{args.height}...")
+            paths = make_images(tmp, args.count, args.width, args.height, args.formats)
+            results = measure(paths, args.hash_size, args.repeat)
+    print_report(results, args.hash_size)
+
+if __name__ == "__main__":
+    main()
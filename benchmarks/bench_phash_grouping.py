@@ -0,0 +1,87 @@
+"""
+查重分组压测：合成 n 个感知哈希(随机哈希 + 一部分在几位以内的近似副本)，
+比较 phash_dedup.group_similar_hashes 的两种方式(NumPy 分块两两比较、多索引哈希) 和原来 Python 两两比较的写法，
+并检查分组完全一致。
+
+例子:
+    python benchmarks/bench_phash_grouping.py
+    python benchmarks/bench_phash_grouping.py --sizes 10000 100000 1000000 --threshold 5 --naive-max 10000
+    python benchmarks/bench_phash_grouping.py --bits 256 --threshold 20 --max-flips 24
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from phash_dedup import _choose_chunks, group_similar_hashes, hamming_edges, pack_hashes
+
+def synthetic_hashes(n, bits=64, duplicate_rate=0.2, max_flips=6, seed=0):
+    """{名字: 整数哈希}，duplicate_rate 的比例是前面某个哈希翻转 0~max_flips 位得到的"""
+    rng = random.Random(seed)
+    values = []
+    for _ in range(n):
+        if values and rng.random() < duplicate_rate:
+            value = rng.choice(values)
+            for bit in rng.sample(range(bits), rng.randint(0, max_flips)):
+                value ^= 1 << bit
+        else:
+            value = rng.getrandbits(bits)
+        values.append(value)
+    return {f"img_{i:07d}.jpg": value for i, value in enumerate(values)}
+
+def naive_groups(image_hashes, threshold):
+    """原来 hash_to_delete.group_similar_images 的两两比较(换成整数，比 ImageHash 相减快很多)"""
+    groups = []
+    processed = set()
+    for path1, hash1 in image_hashes.items():
+        if path1 in processed:
+            continue
+        group = [path1]
+        processed.add(path1)
+        for path2, hash2 in image_hashes.items():
+            if path2 not in processed and (hash1 ^ hash2).bit_count() <= threshold:
+                group.append(path2)
+                processed.add(path2)
+        if len(group) > 1:
+            groups.append(group)
+    return groups
+
+def main():
+    parser = argparse.ArgumentParser(description='感知哈希查重分组压测')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--threshold', type=int, default=5)
+    parser.add_argument('--duplicate-rate', type=float, default=0.2)
+    parser.add_argument('--bits', type=int, default=64, choices=[64, 256], help='哈希位数，256 对应 hash_size=16')
+    parser.add_argument('--max-flips', type=int, default=6, help='近似副本最多翻转的位数')
+    parser.add_argument('--naive-max', type=int, default=10000, help='不超过这个数量时也跑两两比较并核对结果')
+    parser.add_argument('--numpy-max', type=int, default=200000, help='不超过这个数量时跑 NumPy 分块比较')
+    args = parser.parse_args()
+
+    print(f"{'数量':>9} {'分段':>4} {'多索引':>8} {'NumPy':>8} {'边数':>9} {'组数':>8} {'两两比较':>10} {'一致':>4}")
+    for n in args.sizes:
+        hashes = synthetic_hashes(n, bits=args.bits, duplicate_rate=args.duplicate_rate, max_flips=args.max_flips)
+        unique = list(dict.fromkeys(hashes.values()))
+        started = time.perf_counter()
+        groups = group_similar_hashes(hashes, args.threshold, engine='index')
+        elapsed = time.perf_counter() - started
+        results = [groups]
+        numpy_time, edges = '-', '-'
+        if n <= args.numpy_max:
+            started = time.perf_counter()
+            results.append(group_similar_hashes(hashes, args.threshold, engine='numpy'))
+            numpy_time = f"{time.perf_counter() - started:.2f}s"
+            edges = len(hamming_edges(pack_hashes(unique, args.bits), args.threshold)[0])
+        naive = '-'
+        if n <= args.naive_max:
+            started = time.perf_counter()
+            results.append(naive_groups(hashes, args.threshold))
+            naive = f"{time.perf_counter() - started:.2f}s"
+        same = '是' if all(r == results[0] for r in results) else '否'
+        chunks = _choose_chunks(args.bits, args.threshold, len(unique))
+        print(f"{n:>9} {chunks:>4} {elapsed:>7.2f}s {numpy_time:>8} {edges:>9} {len(groups):>8} {naive:>10} {same:>4}")
+
+if __name__ == "__main__":
+    main()
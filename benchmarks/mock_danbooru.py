@@ -0,0 +1,270 @@
+"""
+本地模拟的 Danbooru 服务器，用来离线压测下载器。
+
+- /posts.json 支持 tags / page(数字或 b<id> 游标) / limit，返回结构和 Danbooru 一致的帖子列表，带 ETag
+- /tags.json (search[name_comma]) 和 /counts/posts.json 返回标签/整行的帖子数，给标签预检用
+- /media/<md5>.<ext> 和 /media/sample/<md5>.jpg 返回合成的图片，md5 与列表里的一致，支持 Range 请求
+- ext_weights 里加上 gif 时生成多帧的动图，用来测只取第一帧的分段下载
+- 可以注入延迟、限速(每个连接的带宽)、随机500错误、随机429，以及服务端每秒请求上限
+
+单独运行:
+    python benchmarks/mock_danbooru.py --posts 500 --latency 0.05 --bandwidth 2000000 --throttle-rate 0.05
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+class Corpus:
+    """合成的帖子集合：每个帖子随机挑几个 tag_N 标签，图片用噪声生成(压缩不了，大小接近真实)"""
+    def __init__(self, posts=300, tags=20, tags_per_post=5, width=768, height=1024,
+                 sample_width=384, ext_weights=None, seed=0):
+        rng = random.Random(seed)
+        ext_weights = ext_weights or {'jpg': 6, 'png': 3, 'webp': 1}
+        exts, weights = zip(*ext_weights.items())
+        self.tags = [f"tag_{i}" for i in range(tags)]
+        self.posts = []
+        self.media = {}
+        for post_id in range(posts, 0, -1):
+            ext = rng.choices(exts, weights)[0]
+            w = rng.randint(width // 2, width)
+            h = rng.randint(height // 2, height)
+            original = self._render(w, h, ext, rng)
+            md5 = hashlib.md5(original).hexdigest()
+            sh = max(1, h * sample_width // w)
+            sample = self._render(sample_width, sh, 'jpg', rng)
+            self.media[f"{md5}.{ext}"] = original
+            self.media[f"sample/{md5}.jpg"] = sample
+            self.posts.append({
+                'id': post_id,
+                'md5': md5,
+                'file_ext': ext,
+                'file_size': len(original),
+                'image_width': w,
+                'image_height': h,
+                'rating': rng.choice('gsqe'),
+                'score': rng.randint(-5, 200),
+                'tag_string': ' '.join(sorted(rng.sample(self.tags, min(tags_per_post, tags)))),
+                'file_url': f"/media/{md5}.{ext}",
+                'media_asset': {'variants': [
+                    {'type': 'sample', 'url': f"/media/sample/{md5}.jpg", 'width': sample_width, 'height': sh, 'file_ext': 'jpg'},
+                    {'type': 'original', 'url': f"/media/{md5}.{ext}", 'width': w, 'height': h, 'file_ext': ext},
+                ]},
+            })
+
+    @staticmethod
+    def _render(w, h, ext, rng):
+        img = Image.effect_noise((w, h), 64).convert('RGB')
+        # 每张图加一点不同的底色，保证 md5 不重复
+        img.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)), (0, 0, 8, 8))
+        buf = io.BytesIO()
+        if ext == 'gif':
+            frames = [img] + [Image.effect_noise((w, h), 64).convert('RGB') for _ in range(7)]
+            frames[0].save(buf, 'GIF', save_all=True, append_images=frames[1:], duration=100, loop=0)
+            return buf.getvalue()
+        fmt = {'jpg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}[ext]
+        img.save(buf, fmt, **({'quality': 90} if fmt != 'PNG' else {}))
+        return buf.getvalue()
+
+    def search(self, tags, page=None, limit=20):
+        wanted = [t for t in tags if t and ':' not in t]
+        hits = [p for p in self.posts if all(t in p['tag_string'].split() for t in wanted)]
+        if page and page.startswith('b'):
+            before = int(page[1:])
+            return [p for p in hits if p['id'] < before][:limit]
+        index = (int(page or 1) - 1) * limit
+        return hits[index:index + limit]
+
+class MockDanbooru(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, corpus, latency=0.0, jitter=0.0, bandwidth=None,
+                 error_rate=0.0, throttle_rate=0.0, max_rps=None, seed=0, ranges=True):
+        super().__init__(address, _Handler)
+        self.corpus = corpus
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_rps = max_rps
+        self.ranges = ranges
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = []
+        self.stats = {'requests': 0, 'listing': 0, 'media': 0, 'media_bytes': 0, 'errors': 0, 'throttled': 0, 'not_modified': 0,
+                      'tags': 0, 'counts': 0}
+
+    def handle_error(self, request, client_address):
+        # 客户端拿到第一帧后主动断开是正常情况，不打印
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def decide(self):
+        """返回本次请求要注入的故障: None / 'error' / 'throttle'"""
+        with self.lock:
+            now = time.monotonic()
+            if self.max_rps:
+                self.window = [t for t in self.window if now - t < 1.0]
+                if len(self.window) >= self.max_rps:
+                    return 'throttle'
+                self.window.append(now)
+            roll = self.rng.random()
+        if roll < self.throttle_rate:
+            return 'throttle'
+        if roll < self.throttle_rate + self.error_rate:
+            return 'error'
+        return None
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+        delay = server.latency + (server.rng.uniform(0, server.jitter) if server.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        fault = server.decide()
+        if fault == 'throttle':
+            server.count('throttled')
+            return self._send(429, b'{"success":false,"message":"throttled"}', 'application/json', {'Retry-After': '1'})
+        if fault == 'error':
+            server.count('errors')
+            return self._send(500, b'{"success":false}', 'application/json')
+
+        parts = urlsplit(self.path)
+        if parts.path == '/posts.json':
+            server.count('listing')
+            query = parse_qs(parts.query)
+            tags = query.get('tags', [''])[0].split()
+            limit = min(int(query.get('limit', ['20'])[0]), 200)
+            page = query.get('page', [None])[0]
+            posts = [self._absolute(p) for p in server.corpus.search(tags, page, limit)]
+            body = json.dumps(posts).encode()
+            # 和 Danbooru 一样带 ETag，内容没变时回304
+            etag = f'W/"{hashlib.md5(body).hexdigest()}"'
+            if self.headers.get('If-None-Match') == etag:
+                server.count('not_modified')
+                return self._send(304, b'', 'application/json', {'ETag': etag})
+            return self._send(200, body, 'application/json', {'ETag': etag})
+        if parts.path == '/tags.json':
+            server.count('tags')
+            query = parse_qs(parts.query)
+            names = query.get('search[name_comma]', [''])[0].split(',')
+            tags = [{'name': name, 'post_count': len(server.corpus.search([name], limit=len(server.corpus.posts))),
+                     'category': 0}
+                    for name in names if name in server.corpus.tags]
+            return self._send(200, json.dumps(tags).encode(), 'application/json')
+        if parts.path == '/counts/posts.json':
+            server.count('counts')
+            tags = parse_qs(parts.query).get('tags', [''])[0].split()
+            count = len(server.corpus.search(tags, limit=len(server.corpus.posts)))
+            return self._send(200, json.dumps({'counts': {'posts': count}}).encode(), 'application/json')
+        if parts.path.startswith('/media/'):
+            key = parts.path[len('/media/'):]
+            body = server.corpus.media.get(key)
+            if body is None:
+                return self._send(404, b'not found', 'text/plain')
+            server.count('media')
+            ext = key.rsplit('.', 1)[-1]
+            content_type = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp', 'gif': 'image/gif'}[ext]
+            match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if match and server.ranges:
+                start = int(match[1])
+                end = min(int(match[2]) if match[2] else len(body) - 1, len(body) - 1)
+                if start >= len(body):
+                    return self._send(416, b'', content_type, {'Content-Range': f"bytes */{len(body)}"})
+                server.count('media_bytes', end + 1 - start)
+                return self._send(206, body[start:end + 1], content_type,
+                                  {'Content-Range': f"bytes {start}-{end}/{len(body)}", 'Accept-Ranges': 'bytes'})
+            server.count('media_bytes', len(body))
+            return self._send(200, body, content_type)
+        self._send(404, b'not found', 'text/plain')
+
+    def _absolute(self, post):
+        base = self.server.base_url
+        post = dict(post, file_url=base + post['file_url'])
+        post['media_asset'] = {'variants': [dict(v, url=base + v['url']) for v in post['media_asset']['variants']]}
+        return post
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        bandwidth = self.server.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        # 按每个连接的带宽分块发送
+        chunk = max(1024, int(bandwidth / 20))
+        for start in range(0, len(body), chunk):
+            piece = body[start:start + chunk]
+            self.wfile.write(piece)
+            time.sleep(len(piece) / bandwidth)
+
+def start_server(corpus, host='127.0.0.1', port=0, **options):
+    """在后台线程启动服务器，返回 server（server.base_url 是地址，用完调用 server.shutdown()）"""
+    server = MockDanbooru((host, port), corpus, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_server_arguments(parser):
+    parser.add_argument('--posts', type=int, default=300, help='合成的帖子数')
+    parser.add_argument('--tags', type=int, default=20, help='标签种类数 (tag_0 ... tag_N-1)')
+    parser.add_argument('--width', type=int, default=768, help='原图最大宽度')
+    parser.add_argument('--height', type=int, default=1024, help='原图最大高度')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的固定延迟(秒)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='在固定延迟上再加 0~jitter 秒')
+    parser.add_argument('--bandwidth', type=float, default=None, help='每个连接的带宽(字节/秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机返回500的比例')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='随机返回429的比例')
+    parser.add_argument('--max-rps', type=float, default=None, help='服务端每秒请求上限，超过返回429')
+    parser.add_argument('--seed', type=int, default=0)
+
+def server_options(args):
+    return dict(latency=args.latency, jitter=args.jitter, bandwidth=args.bandwidth,
+                error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                max_rps=args.max_rps, seed=args.seed)
+
+def build_corpus(args):
+    return Corpus(posts=args.posts, tags=args.tags, width=args.width, height=args.height, seed=args.seed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地模拟 Danbooru 服务器')
+    add_server_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    print(f"生成合成数据: {args.posts} 个帖子...")
+    server = MockDanbooru((args.host, args.port), build_corpus(args), **server_options(args))
+    print(f"模拟服务器已启动: {server.base_url}  (把 downloader_engine.API_BASE 改成这个地址)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n统计: {server.stats}")
@@ -0,0 +1,72 @@
+# 需要保留下划线的特殊符号集合
+EXCLUDE_SYMBOLS = {"0_0", "(o)_(o)", "+_+", "+_-", "._.", "<o>_<o>",
+                   "<|>_<|>", "=_=", ">_<", "3_3", "6_9", ">_o", "@_@",
+                   "^_^", "o_o", "u_u", "x_x", "|_|", "||_||"}
+
+# Danbooru 的标签类别，对应帖子里的 tag_string_<类别>
+TAG_CATEGORIES = ('artist', 'character', 'copyright', 'general', 'meta')
+
+RATING_TAGS = {'g': 'general', 's': 'sensitive', 'q': 'questionable', 'e': 'explicit'}
+
+# 规则名 -> 说明。不传规则(None)时和下载器原来的写法完全一样
+CAPTION_RULES = {
+    'categories': '按这个顺序输出的类别，例如 [\'character\', \'copyright\', \'artist\', \'general\']，不在列表里的类别丢掉；None 按 tag_string 原顺序',
+    'keep_symbols': '表情符号(EXCLUDE_SYMBOLS)保留下划线，默认 True',
+    'underscore_to_space': '下划线换成空格，默认 True',
+    'rating': '在最前面加分级标签: True 用 general/sensitive/...，也可以传 {\'g\': \'safe\', ...}',
+    'artist_prefix': '画师标签加前缀，例如 \'by \'（需要设置 categories 才能区分画师）',
+    'exclude_tags': '不写进TXT的标签(Danbooru原名)',
+    'prepend': '固定加在最前面的标签，例如触发词',
+    'separator': '分隔符，默认 \', \'',
+}
+
+def danbooru_caption(item):
+    """默认的TXT标签内容：标签用逗号分隔，下划线换成空格"""
+    tag_string = item.get('tag_string', '')
+    return tag_string.replace(' ', ',').replace('_', ' ')
+
+def make_caption(rules=None):
+    """
+    按规则生成 item -> TXT标签内容 的函数，可用的键见 CAPTION_RULES，例如:
+        {'categories': ['character', 'copyright', 'artist', 'general'], 'rating': True,
+         'artist_prefix': 'by ', 'exclude_tags': ['commentary_request'], 'prepend': ['my_trigger']}
+    """
+    if rules is None:
+        return danbooru_caption
+    rules = dict(rules)
+    unknown = set(rules) - set(CAPTION_RULES)
+    if unknown:
+        raise ValueError(f"未知的标签规则: {', '.join(sorted(unknown))}")
+    categories = rules.get('categories')
+    keep_symbols = rules.get('keep_symbols', True)
+    underscore_to_space = rules.get('underscore_to_space', True)
+    rating = rules.get('rating')
+    if rating is True:
+        rating = RATING_TAGS
+    artist_prefix = rules.get('artist_prefix') or ''
+    exclude_tags = set(rules.get('exclude_tags') or ())
+    prepend = list(rules.get('prepend') or ())
+    separator = rules.get('separator', ', ')
+
+    def format_tag(tag):
+        if underscore_to_space and not (keep_symbols and tag in EXCLUDE_SYMBOLS):
+            return tag.replace('_', ' ')
+        return tag
+
+    def caption(item):
+        if categories is None:
+            groups = [('', item.get('tag_string', '').split())]
+        else:
+            groups = [(category, item.get(f'tag_string_{category}', '').split()) for category in categories]
+        tags = list(prepend)
+        if rating and item.get('rating') in rating:
+            tags.append(rating[item['rating']])
+        for category, names in groups:
+            for name in names:
+                if name in exclude_tags:
+                    continue
+                tag = format_tag(name)
+                tags.append(artist_prefix + tag if category == 'artist' else tag)
+        return separator.join(tags)
+
+    return caption
@@ -0,0 +1,48 @@
+import os
+import shutil
+from pathlib import Path
+
+# 所有下载的文件只在这里存一份，按 md5 命名
+STORE_DIRNAME = ".store"
+
+def store_path(base_save_dir, md5, ext):
+    """保存目录/.store/ab/abcdef....ext，前两位分桶避免单个目录文件过多"""
+    ext = ext.lstrip('.').lower()
+    return Path(base_save_dir) / STORE_DIRNAME / md5[:2] / f"{md5}.{ext}"
+
+def link_file(src, dst, link_mode='hardlink'):
+    """
+    把 src 放到 dst：优先硬链接，不支持时(跨盘/文件系统限制)退回符号链接，再不行就复制。
+    link_mode='copy' 时直接复制。返回实际使用的方式，dst 已存在时返回 'exists'。
+    """
+    src, dst = Path(src), Path(dst)
+    if dst.exists() or dst.is_symlink():
+        return 'exists'
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if link_mode in ('hardlink', 'symlink'):
+        if link_mode == 'hardlink':
+            try:
+                os.link(src, dst)
+                return 'hardlink'
+            except OSError:
+                pass
+        try:
+            os.symlink(os.path.relpath(src.resolve(), dst.parent.resolve()), dst)
+            return 'symlink'
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return 'copy'
+
+def materialize(stored_file, target_dir, link_mode='hardlink'):
+    """
+    把仓库里的文件放进标签文件夹。图片用链接，同名TXT标签总是复制一份，
+    这样之后在某个文件夹里改标签不会影响其它文件夹。返回标签文件夹里的图片路径。
+    """
+    stored_file = Path(stored_file)
+    target = Path(target_dir) / stored_file.name
+    link_file(stored_file, target, link_mode)
+    stored_txt = stored_file.with_suffix('.txt')
+    if stored_txt.exists():
+        link_file(stored_txt, target.with_suffix('.txt'), 'copy')
+    return target
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, UnidentifiedImageError
+
+try:
+    import av  # 可选，用来取视频的第一帧
+except ImportError:
+    av = None
+
+HAS_VIDEO_DECODER = av is not None
+
+def alpha_fill(img, color=(255, 255, 255)):
+    """透明部分填充成纯色（和 fill_img.py 一样默认白色）"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGBA', img.size, tuple(color) + (255,))
+        img = Image.alpha_composite(background, img)
+    return img.convert('RGB')
+
+def resize(img, max_side=2048):
+    """长边超过 max_side 时等比缩小"""
+    if max(img.size) > max_side:
+        img = img.copy()
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    return img
+
+# 可用的转换步骤，steps 里按名字引用，例如 [('alpha_fill', {}), ('resize', {'max_side': 1536})]
+TRANSFORMS = {
+    'alpha_fill': alpha_fill,
+    'resize': resize,
+}
+
+def open_first_frame(src_path):
+    """用PIL打开图片；PIL不认识的文件(视频)在装了 PyAV 时解码第一帧"""
+    try:
+        return Image.open(src_path)
+    except UnidentifiedImageError:
+        if av is None:
+            raise
+    try:
+        with av.open(str(src_path)) as container:
+            for frame in container.decode(video=0):
+                return frame.to_image()
+    except Exception as e:
+        # PyAV 的异常不一定能在进程间传递，统一换成PIL的异常
+        raise UnidentifiedImageError(f"无法解码视频第一帧: {e}")
+    raise UnidentifiedImageError("视频中没有可解码的帧")
+
+def transform_image(src_path, dst_path, steps=(), first_frame=False):
+    """
+    读取 src_path，依次执行 steps，按 dst_path 的扩展名保存（.jpg 存 JPEG，其它按原格式）。
+    先写临时文件再原子重命名到 dst_path。
+    """
+    tmp_path = dst_path.with_name(dst_path.name + '.tmp')
+    is_jpeg = dst_path.suffix.lower() in ('.jpg', '.jpeg')
+    try:
+        with open_first_frame(src_path) as img:
+            if first_frame:
+                img.seek(0)
+            fmt = 'JPEG' if is_jpeg else img.format
+            for name, params in steps:
+                img = TRANSFORMS[name](img, **(params or {}))
+            if is_jpeg and img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.save(tmp_path, fmt, **({'quality': 95} if is_jpeg else {}))
+        os.replace(tmp_path, dst_path)
+    finally:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+
+def _transform_job(src_path, dst_path, steps, first_frame):
+    # 在子进程里执行，返回实际耗费的CPU时间段
+    start = time.perf_counter()
+    transform_image(src_path, dst_path, steps, first_frame)
+    return time.perf_counter() - start
+
+class StageTimer:
+    """按阶段累计耗时，用来看时间花在网络上还是CPU上"""
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def add(self, stage, seconds, nbytes=0):
+        self.totals[stage] += seconds
+        self.counts[stage] += 1
+        self.bytes[stage] += nbytes
+
+    def report(self, wall_time=None):
+        print("\n阶段耗时 (各任务累计，并发时总和会超过实际用时):")
+        for stage in sorted(self.totals, key=self.totals.get, reverse=True):
+            total, count = self.totals[stage], self.counts[stage]
+            print(f"  {stage}: {total:.2f} 秒, {count} 次, 平均 {total / count * 1000:.1f} 毫秒")
+        if wall_time is not None:
+            print(f"  实际用时: {wall_time:.2f} 秒")
+
+class ConvertPool:
+    """
+    把图片解码/转换(转JPEG、透明填充、缩放等)放到进程池里做，事件循环只负责网络IO。
+    同时提交的任务数不超过 max_pending，满了之后新的转换在这里排队(背压)，
+    不会把整批下载好的文件都堆进进程池的队列里。
+    """
+    def __init__(self, max_workers=None, max_pending=None, timer=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 2
+        self.timer = timer
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._semaphore = asyncio.Semaphore(self.max_pending)
+        # 排队等待提交的、已提交到进程池的任务数
+        self.queued = 0
+        self.running = 0
+
+    async def transform(self, src_path, dst_path, steps=(), first_frame=False):
+        loop = asyncio.get_running_loop()
+        queued = time.perf_counter()
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            submitted = time.perf_counter()
+            cpu_seconds = await loop.run_in_executor(
+                self._executor, _transform_job, src_path, dst_path, tuple(steps), first_frame
+            )
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+        if self.timer is not None:
+            self.timer.add('convert_wait', submitted - queued)
+            self.timer.add('convert', cpu_seconds)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
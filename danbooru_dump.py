@@ -0,0 +1,269 @@
+import gzip
+import json
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+
+from tag_preflight import METATAGS
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+DUMP_DB_FILENAME = "danbooru_dump.sqlite"
+
+# 导出的元数据里通常没有 file_url，按 md5 拼出 Danbooru CDN 上原图的地址
+DUMP_MEDIA_BASE = "https://cdn.donmai.us"
+
+# 能在本地回答的元标签，其它元标签(order:/score:/date: 等)的行仍然请求 posts.json
+LOCAL_METATAGS = {'rating'}
+
+def read_dump(path, batch_size=10000):
+    """按批读取元数据导出文件: .jsonl / .jsonl.gz / .json(数组) / .parquet（需要 pip install pyarrow）"""
+    path = Path(path)
+    suffixes = [s.lower() for s in path.suffixes]
+    if suffixes and suffixes[-1] == '.parquet':
+        if pq is None:
+            raise RuntimeError(f"读取 {path} 需要 pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield batch.to_pylist()
+        return
+    opener = gzip.open if suffixes and suffixes[-1] == '.gz' else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        if first == '[':
+            # 整个文件是一个 JSON 数组
+            items = json.loads(first + f.read())
+            for i in range(0, len(items), batch_size):
+                yield items[i:i + batch_size]
+            return
+        batch = []
+        for line in _chain_first(first + f.readline() if first else '', f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                batch.append(json.loads(line))
+            except ValueError:
+                continue
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def _chain_first(first_line, f):
+    if first_line:
+        yield first_line
+    yield from f
+
+def _tag_string(item):
+    if item.get('tag_string') is not None:
+        return item['tag_string']
+    return ' '.join(item.get(f'tag_string_{category}') or ''
+                    for category in ('artist', 'copyright', 'character', 'general', 'meta')).strip()
+
+def _normalize(item, media_base):
+    """补上 file_url 和 tag_string，返回 None 表示这个帖子不能下载（已删除/被封禁/没有md5）"""
+    if item.get('is_deleted') or item.get('is_banned'):
+        return None
+    md5 = item.get('md5')
+    ext = item.get('file_ext')
+    if not md5 and not item.get('file_url'):
+        return None
+    item = {k: v for k, v in item.items() if v is not None}
+    item['tag_string'] = _tag_string(item)
+    if not item.get('file_url') and md5 and ext:
+        item['file_url'] = f"{media_base}/original/{md5[:2]}/{md5[2:4]}/{md5}.{ext}"
+    return item
+
+def parse_line(line):
+    """
+    把一行标签拆成 (必须有的标签, 不能有的标签, 允许的分级)；有本地回答不了的写法时返回None。
+    支持普通标签、-标签、rating:x / -rating:x（可以用逗号写多个分级）。
+    """
+    include, exclude = [], []
+    ratings = set('gsqe')
+    for token in line.strip().split(' '):
+        if not token:
+            continue
+        negated = token.startswith('-')
+        name = token[1:] if negated else token
+        if not name or name[0] == '~' or '*' in name:
+            return None
+        prefix, sep, value = name.partition(':')
+        if sep and prefix.lower() in LOCAL_METATAGS:
+            values = {v[:1].lower() for v in value.split(',') if v}
+            ratings = ratings - values if negated else ratings & values
+            continue
+        if sep and prefix.lower() in METATAGS:
+            # order:/score: 等元标签交给 API；普通标签里也可能有冒号，例如 emilia_(re:zero)
+            return None
+        (exclude if negated else include).append(name.lower())
+    return include, exclude, ratings
+
+class DumpIndex:
+    """
+    从 Danbooru 元数据导出文件建的本地索引(SQLite)：标签 -> 帖子id、md5、完整帖子(含variants)。
+    能本地回答的行按 posts.json 一样的游标翻页返回帖子，下载阶段只请求媒体文件。
+    导出是某个时间点的快照，之后的新帖子不在里面，需要时重新导入。
+    """
+    def __init__(self, path=DUMP_DB_FILENAME):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS posts (
+                id INTEGER PRIMARY KEY,
+                md5 TEXT,
+                rating TEXT,
+                data BLOB
+            );
+            CREATE INDEX IF NOT EXISTS posts_md5 ON posts (md5);
+            CREATE TABLE IF NOT EXISTS post_tags (
+                tag TEXT,
+                post_id INTEGER,
+                PRIMARY KEY (tag, post_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS tags (
+                name TEXT PRIMARY KEY,
+                post_count INTEGER
+            );
+        """)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def ingest(self, paths, media_base=DUMP_MEDIA_BASE, batch_size=10000):
+        """导入一个或多个导出文件，同一个帖子id以后导入的为准，返回导入的帖子数"""
+        if isinstance(paths, (str, Path)):
+            paths = [paths]
+        started = time.perf_counter()
+        total = skipped = 0
+        # 导入时不需要每批都落盘，最后统一提交
+        self._conn.execute("PRAGMA synchronous=OFF")
+        for path in paths:
+            print(f"导入元数据: {path}")
+            for batch in read_dump(path, batch_size):
+                items = []
+                for item in batch:
+                    item = _normalize(item, media_base)
+                    if item is None or item.get('id') is None:
+                        skipped += 1
+                        continue
+                    items.append(item)
+                self._replace(items)
+                total += len(items)
+                print(f"  已导入 {total} 个帖子, 跳过 {skipped} 个 ({time.perf_counter() - started:.1f} 秒)")
+        print("统计标签帖子数...")
+        self._conn.execute("DELETE FROM tags")
+        self._conn.execute("INSERT INTO tags SELECT tag, COUNT(*) FROM post_tags GROUP BY tag")
+        self._conn.commit()
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        print(f"导入完成: {total} 个帖子, 跳过 {skipped} 个(已删除/无文件), 用时 {time.perf_counter() - started:.1f} 秒")
+        return total
+
+    def _replace(self, items):
+        ids = [item['id'] for item in items]
+        # 重新导入的帖子先删掉旧的标签
+        old = []
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self._conn.execute(
+                f"SELECT id, data FROM posts WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for post_id, data in rows:
+                old.extend((tag, post_id) for tag in set(json.loads(zlib.decompress(data))['tag_string'].split()))
+        if old:
+            self._conn.executemany("DELETE FROM post_tags WHERE tag = ? AND post_id = ?", old)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO posts (id, md5, rating, data) VALUES (?, ?, ?, ?)",
+            [(item['id'], item.get('md5'), item.get('rating'),
+              zlib.compress(json.dumps(item, ensure_ascii=False, separators=(',', ':')).encode('utf-8')))
+             for item in items]
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO post_tags (tag, post_id) VALUES (?, ?)",
+            # 按标签排序后插入，B树的写入集中在少数页上
+            sorted((tag, item['id']) for item in items for tag in set(item['tag_string'].split()))
+        )
+
+    def tag_count(self, tag):
+        row = self._conn.execute("SELECT post_count FROM tags WHERE name = ?", (tag,)).fetchone()
+        return row[0] if row else 0
+
+    def supports(self, line):
+        """这一行能不能在本地回答"""
+        return parse_line(line) is not None
+
+    def _query(self, line):
+        include, exclude, ratings = parse_line(line)
+        params = []
+        if include:
+            # 从帖子最少的标签开始按id倒序扫，其余条件逐个检查，拿够一页就停
+            include = sorted(include, key=self.tag_count)
+            sql = "SELECT t0.post_id FROM post_tags t0 JOIN posts p ON p.id = t0.post_id WHERE t0.tag = ?"
+            params.append(include[0])
+            id_column = 't0.post_id'
+        else:
+            sql = "SELECT p.id FROM posts p WHERE 1"
+            id_column = 'p.id'
+        for tag in include[1:]:
+            sql += f" AND EXISTS (SELECT 1 FROM post_tags t WHERE t.tag = ? AND t.post_id = {id_column})"
+            params.append(tag)
+        for tag in exclude:
+            sql += f" AND NOT EXISTS (SELECT 1 FROM post_tags t WHERE t.tag = ? AND t.post_id = {id_column})"
+            params.append(tag)
+        if ratings != set('gsqe'):
+            sql += f" AND p.rating IN ({','.join('?' * len(ratings))})"
+            params.extend(sorted(ratings))
+        return sql, params, id_column
+
+    def search(self, line, page='b', limit=200):
+        """和 posts.json 一样按id倒序分页：page 为 'b'(最新)、'b<id>'(id之前) 或页码，返回帖子列表"""
+        sql, params, id_column = self._query(line)
+        if page.startswith('b') and len(page) > 1:
+            sql += f" AND {id_column} < ?"
+            params.append(int(page[1:]))
+        sql += f" ORDER BY {id_column} DESC LIMIT ?"
+        params.append(limit)
+        if not page.startswith('b'):
+            sql += " OFFSET ?"
+            params.append((int(page) - 1) * limit)
+        ids = [row[0] for row in self._conn.execute(sql, params)]
+        if not ids:
+            return []
+        rows = dict(self._conn.execute(
+            f"SELECT id, data FROM posts WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall())
+        return [json.loads(zlib.decompress(rows[post_id])) for post_id in ids]
+
+    def count(self, line):
+        sql, params, _ = self._query(line)
+        return self._conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+if __name__ == "__main__":
+    # 导出文件，每行一个 posts.json 格式的帖子(JSONL，可以是.gz)，或 Parquet
+    dump_paths = ["posts.jsonl.gz"]
+    db_path = DUMP_DB_FILENAME  # 导入后在下载器里设置 dump_path = 这个文件
+    media_base = DUMP_MEDIA_BASE  # 导出里没有 file_url 时用来拼原图地址
+
+    with DumpIndex(db_path) as dump:
+        dump.ingest(dump_paths, media_base=media_base)
+        print(f"本地索引共 {len(dump)} 个帖子: {db_path}")
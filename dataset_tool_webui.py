@@ -6,6 +6,7 @@ import time
 import io
 import contextlib
 import shutil
+import threading
 from PIL import Image
 
 # 添加当前路径到 path 以便 import 本地模块
@@ -30,6 +31,7 @@ try:
     import fill_img
     import ganther_children_folders_to_one_folder as merge_folders
     import downloader_for_lora_train as downloader
+    from download_metrics import load_snapshot
     import saucenao
     from tagger_api import TaggerAPIClient
     # ComfyUI Imports
@@ -374,27 +376,78 @@ def render_downloader():
                 st.error("请输入文件名")
 
     st.markdown("---")
-    if st.button("开始下载", type="primary"):
+    quiet = st.checkbox("减少控制台输出 (不再每个文件打印一行，定期打印汇总进度)", value=False)
+    task = st.session_state.get('dl_task')
+    running = task is not None and task['thread'].is_alive()
+    if st.button("开始下载", type="primary", disabled=running):
         if not txt_path or not os.path.exists(txt_path):
             st.error("请选择或创建一个有效的 TXT 文件")
             return
-            
-        status = st.empty()
-        status.info("正在初始化下载任务...")
-        
-        async def run_task():
-            await downloader.run_downloader(
-                txt_path=txt_path,
-                save_dir=save_dir,
-                timeout=timeout,
-                proxies=proxies,
-                max_lines_per_batch=max_batch,
-                max_images=max_images,
-                start_line=start_line
+
+        # 下载在后台线程里跑，页面定期读取保存目录里的指标快照显示进度
+        task = {'save_dir': save_dir, 'started': time.time(), 'error': None}
+
+        def run_task():
+            try:
+                asyncio.run(downloader.run_downloader(
+                    txt_path=txt_path,
+                    save_dir=save_dir,
+                    timeout=timeout,
+                    proxies=proxies,
+                    max_lines_per_batch=max_batch,
+                    max_images=max_images,
+                    start_line=start_line,
+                    verbose=not quiet
+                ))
+            except Exception as e:
+                task['error'] = e
+
+        task['thread'] = threading.Thread(target=run_task, daemon=True)
+        task['thread'].start()
+        st.session_state.dl_task = task
+
+    render_download_progress()
+
+def render_download_progress():
+    task = st.session_state.get('dl_task')
+    if task is None:
+        return
+    running = task['thread'].is_alive()
+    st.subheader("下载进度")
+    snapshot = load_snapshot(task['save_dir'])
+    # 保存目录里可能还留着上一次任务的快照
+    if snapshot and snapshot['updated_at'] >= task['started']:
+        summary = snapshot['summary']
+        posts = summary['posts']
+        cols = st.columns(6)
+        cols[0].metric("已下载", posts['downloaded'])
+        cols[1].metric("已存在(链接)", posts['linked'])
+        cols[2].metric("跳过 / 失败", f"{posts['skipped']} / {posts['failed']}")
+        cols[3].metric("速度", f"{summary['bytes_per_s'] / 1024 / 1024:.2f} MB/s")
+        cols[4].metric("请求 / 重试", f"{summary['requests']} / {summary['retries']}")
+        cols[5].metric("已用时间", f"{snapshot['elapsed']:.0f} 秒")
+
+        gauges = snapshot['gauges']
+        in_flight = sum(gauges.get('http_in_flight', {}).values())
+        lines = gauges.get('lines', {})
+        st.caption(f"在途请求 {in_flight} | 处理中的行 {lines.get('state=running', 0)}, 排队的行 {lines.get('state=waiting', 0)} | "
+                   f"转换中 {sum(gauges.get('convert_running', {}).values())}, 转换排队 {sum(gauges.get('convert_queued', {}).values())}")
+        statuses = snapshot['counters'].get('http_responses_total', {})
+        if statuses:
+            st.dataframe(
+                [dict((pair.split('=', 1) for pair in key.split(',')), 次数=int(value)) for key, value in statuses.items()],
+                use_container_width=True
             )
-            
-        asyncio.run(run_task())
-        status.success("任务完成！")
+    elif running:
+        st.info("正在初始化下载任务...")
+
+    if running:
+        time.sleep(2)
+        st.rerun()
+    elif task['error'] is not None:
+        st.error(f"下载出错: {task['error']}")
+    else:
+        st.success("任务完成！")
 
 def render_add_prefix():
     st.header("🏷️ 批量添加前缀")
@@ -554,14 +607,38 @@ def render_merge_folders():
 def render_hash_dedup():
     st.header("🧩 哈希去重")
     target_dir = st_directory_selector(st.empty(), key="hash_dir", initial_path=".")
-    threshold = st.slider("相似度阈值 (越小越相似)", 0, 20, 5)
+    hash_size = st.selectbox("哈希大小", [8, 16], format_func=lambda n: f"{n * n} 位", help="256 位更精细，阈值大约放大到 4 倍")
+    threshold = st.slider("相似度阈值 (越小越相似)", 0, 20 if hash_size == 8 else 80, 5 if hash_size == 8 else 20)
     
     if 'hash_groups' not in st.session_state:
         st.session_state.hash_groups = None
+    if 'hash_resolutions' not in st.session_state:
+        st.session_state.hash_resolutions = {}
+
+    workers = st.number_input("哈希进程数 (0 为按CPU核数)", min_value=0, max_value=256, value=0)
+    use_cache = st.checkbox("使用哈希缓存", value=True, help="哈希存在文件夹里的 .phash_cache.sqlite，再次扫描只计算新增和修改过的图片")
 
     if st.button("扫描重复图片"):
+        progress_text = st.empty()
+        progress_bar = st.progress(0)
+        last = {'time': 0.0}
+
+        def on_progress(done, total):
+            # 每张图都刷新界面太慢，最多每0.2秒刷新一次
+            now = time.time()
+            if done != total and now - last['time'] < 0.2:
+                return
+            last['time'] = now
+            progress_text.text(f"正在计算哈希 ({done}/{total})")
+            progress_bar.progress(done / total)
+
         with st.spinner("正在计算哈希..."):
-            st.session_state.hash_groups = find_duplicate_images(target_dir, threshold)
+            st.session_state.hash_resolutions = {}
+            st.session_state.hash_groups = find_duplicate_images(
+                target_dir, threshold, workers=workers or None, progress=on_progress, use_cache=use_cache,
+                hash_size=hash_size, resolutions=st.session_state.hash_resolutions
+            )
+        progress_text.text("哈希计算完成，已分组")
         
     if st.session_state.hash_groups:
         st.write(f"发现 {len(st.session_state.hash_groups)} 组重复图片")
@@ -578,7 +655,8 @@ def render_hash_dedup():
                 method = 'auto_all'
                 delete_txt = st.checkbox("同时删除对应的TXT", value=True)
             
-            results = process_duplicate_groups(st.session_state.hash_groups, method, delete_txt)
+            results = process_duplicate_groups(st.session_state.hash_groups, method, delete_txt,
+                                               resolutions=st.session_state.hash_resolutions)
             
             if method == 'manual':
                 for item in results:
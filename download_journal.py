@@ -0,0 +1,135 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+JOURNAL_FILENAME = "download_journal.sqlite"
+
+class DownloadJournal:
+    """
+    断点续传日志：
+    - 每个标签行记录下一次要请求的页(游标)、已完成数量、是否已经没有更多结果
+    - 每个帖子记录完成状态，失败的帖子连同 item 一起保存，留到后面重试而不是中断整个任务
+    每次更新都立即提交，崩溃/Ctrl-C 后可以从停下的位置继续。
+    """
+    def __init__(self, base_save_dir):
+        self.base_dir = Path(base_save_dir)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.base_dir / JOURNAL_FILENAME
+        self._conn = sqlite3.connect(self.db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS lines (
+                line TEXT PRIMARY KEY,
+                next_page TEXT,
+                processed_count INTEGER DEFAULT 0,
+                exhausted INTEGER DEFAULT 0,
+                updated_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS posts (
+                line TEXT,
+                md5 TEXT,
+                state TEXT,
+                attempts INTEGER DEFAULT 0,
+                filename TEXT,
+                item TEXT,
+                updated_at REAL,
+                PRIMARY KEY (line, md5)
+            );
+            CREATE INDEX IF NOT EXISTS idx_posts_state ON posts(state);
+        """)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def reset(self):
+        self._conn.execute("DELETE FROM lines")
+        self._conn.execute("DELETE FROM posts")
+        self._conn.commit()
+
+    def line_state(self, line):
+        row = self._conn.execute(
+            "SELECT next_page, processed_count, exhausted FROM lines WHERE line = ?", (line,)
+        ).fetchone()
+        if not row:
+            return {'next_page': None, 'processed_count': 0, 'exhausted': False}
+        return {'next_page': row[0], 'processed_count': row[1], 'exhausted': bool(row[2])}
+
+    def save_line(self, line, next_page, processed_count, exhausted=False):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO lines (line, next_page, processed_count, exhausted, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (line, None if next_page is None else str(next_page), processed_count, int(exhausted), time.time())
+        )
+        self._conn.commit()
+
+    def add_processed(self, line, count=1):
+        self._conn.execute(
+            "UPDATE lines SET processed_count = processed_count + ?, updated_at = ? WHERE line = ?",
+            (count, time.time(), line)
+        )
+        self._conn.commit()
+
+    def post_state(self, line, md5):
+        row = self._conn.execute(
+            "SELECT state FROM posts WHERE line = ? AND md5 = ?", (line, md5)
+        ).fetchone()
+        return row[0] if row else None
+
+    def mark_done(self, line, md5):
+        self._conn.execute(
+            "INSERT INTO posts (line, md5, state, attempts, updated_at) VALUES (?, ?, 'done', 1, ?) "
+            "ON CONFLICT(line, md5) DO UPDATE SET state = 'done', attempts = attempts + 1, "
+            "item = NULL, updated_at = excluded.updated_at",
+            (line, md5, time.time())
+        )
+        self._conn.commit()
+
+    def mark_skipped(self, line, md5):
+        """类型不需要或文件本身有问题，不再重试"""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO posts (line, md5, state, attempts, updated_at) VALUES (?, ?, 'skipped', 1, ?)",
+            (line, md5, time.time())
+        )
+        self._conn.commit()
+
+    def mark_failed(self, line, md5, item, filename, max_attempts):
+        """记录一次失败，超过 max_attempts 次后标记为放弃"""
+        row = self._conn.execute(
+            "SELECT attempts FROM posts WHERE line = ? AND md5 = ?", (line, md5)
+        ).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        state = 'failed' if attempts < max_attempts else 'gave_up'
+        self._conn.execute(
+            "INSERT OR REPLACE INTO posts (line, md5, state, attempts, filename, item, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (line, md5, state, attempts, str(filename), json.dumps(item, ensure_ascii=False), time.time())
+        )
+        self._conn.commit()
+        return state
+
+    def done_count(self, line):
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM posts WHERE line = ? AND state = 'done'", (line,)
+        ).fetchone()[0]
+
+    def pending_count(self, line):
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM posts WHERE line = ? AND state = 'failed'", (line,)
+        ).fetchone()[0]
+
+    def failed_posts(self):
+        rows = self._conn.execute(
+            "SELECT line, md5, filename, item, attempts FROM posts WHERE state = 'failed' ORDER BY updated_at"
+        ).fetchall()
+        return [
+            {'line': line, 'md5': md5, 'filename': Path(filename), 'item': json.loads(item), 'attempts': attempts}
+            for line, md5, filename, item, attempts in rows
+        ]
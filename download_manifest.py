@@ -0,0 +1,156 @@
+import asyncio
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+MANIFEST_FILENAME = "download_manifest.sqlite"
+
+# 旧目录迁移时认作已下载的文件类型
+MEDIA_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.mp4', '.webm', '.zip'}
+
+class DownloadManifest:
+    """
+    下载清单，记录每个已下载帖子的 md5 / post id / 最终路径 / 大小，以及认领过它的标签行。
+    查询走SQLite索引，不需要扫描文件系统；路径相对保存目录存储，整个目录搬走后依然有效。
+    """
+    def __init__(self, base_save_dir):
+        self.base_dir = Path(base_save_dir)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.base_dir / MANIFEST_FILENAME
+        self._conn = sqlite3.connect(self.db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS posts (
+                md5 TEXT PRIMARY KEY,
+                post_id INTEGER,
+                path TEXT,
+                size INTEGER,
+                created_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_posts_post_id ON posts(post_id);
+            CREATE TABLE IF NOT EXISTS claims (
+                md5 TEXT,
+                line TEXT,
+                PRIMARY KEY (md5, line)
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._conn.commit()
+        # 正在下载中的md5 -> 下载结束时触发的事件，防止并发的多个标签行重复下载同一个帖子
+        self._in_progress = {}
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def has(self, md5=None, post_id=None):
+        if md5:
+            row = self._conn.execute("SELECT 1 FROM posts WHERE md5 = ?", (md5,)).fetchone()
+            if row:
+                return True
+        if post_id is not None:
+            row = self._conn.execute("SELECT 1 FROM posts WHERE post_id = ?", (post_id,)).fetchone()
+            if row:
+                return True
+        return False
+
+    def get(self, md5):
+        row = self._conn.execute(
+            "SELECT md5, post_id, path, size FROM posts WHERE md5 = ?", (md5,)
+        ).fetchone()
+        if not row:
+            return None
+        return {'md5': row[0], 'post_id': row[1], 'path': self.base_dir / row[2], 'size': row[3]}
+
+    def reserve(self, md5, post_id=None):
+        """已下载或正在下载都返回False，否则占位并返回True"""
+        if md5 in self._in_progress or self.has(md5, post_id):
+            return False
+        self._in_progress[md5] = asyncio.Event()
+        return True
+
+    def release(self, md5):
+        event = self._in_progress.pop(md5, None)
+        if event is not None:
+            event.set()
+
+    async def wait_for(self, md5):
+        """等其它任务下载完这个md5（成功或失败都会返回）"""
+        event = self._in_progress.get(md5)
+        if event is not None:
+            await event.wait()
+
+    def add(self, md5, post_id, path, size=None, line=None):
+        path = Path(path)
+        if size is None:
+            size = path.stat().st_size
+        try:
+            rel_path = path.resolve().relative_to(self.base_dir.resolve())
+        except ValueError:
+            rel_path = path
+        self._conn.execute(
+            "INSERT OR REPLACE INTO posts (md5, post_id, path, size, created_at) VALUES (?, ?, ?, ?, ?)",
+            (md5, post_id, rel_path.as_posix(), size, time.time())
+        )
+        if line is not None:
+            self._conn.execute("INSERT OR IGNORE INTO claims (md5, line) VALUES (?, ?)", (md5, line))
+        self._conn.commit()
+        self.release(md5)
+
+    def forget(self, md5):
+        self._conn.execute("DELETE FROM posts WHERE md5 = ?", (md5,))
+        self._conn.commit()
+
+    def add_claim(self, md5, line):
+        self._conn.execute("INSERT OR IGNORE INTO claims (md5, line) VALUES (?, ?)", (md5, line))
+        self._conn.commit()
+
+    def claims(self, md5):
+        return [row[0] for row in self._conn.execute("SELECT line FROM claims WHERE md5 = ?", (md5,))]
+
+    def get_meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+        self._conn.commit()
+
+    def import_existing(self):
+        """
+        从旧版本的保存目录迁移：只在第一次打开时扫描一遍子文件夹，以文件名(md5)登记。
+        返回登记的文件数，已迁移过返回0。
+        """
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'imported'").fetchone()
+        if row:
+            return 0
+        count = 0
+        for sub_dir in self.base_dir.iterdir():
+            if not sub_dir.is_dir() or sub_dir.name.startswith('.'):
+                continue
+            for entry in os.scandir(sub_dir):
+                stem, ext = os.path.splitext(entry.name)
+                if not entry.is_file() or ext.lower() not in MEDIA_EXTENSIONS:
+                    continue
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO posts (md5, post_id, path, size, created_at) VALUES (?, NULL, ?, ?, ?)",
+                    (stem, f"{sub_dir.name}/{entry.name}", entry.stat().st_size, time.time())
+                )
+                count += cursor.rowcount
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported', ?)", (str(time.time()),))
+        self._conn.commit()
+        return count
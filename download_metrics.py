@@ -0,0 +1,187 @@
+import asyncio
+import bisect
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from convert_pool import StageTimer
+
+METRICS_JSON_FILENAME = "download_metrics.json"
+METRICS_PROM_FILENAME = "download_metrics.prom"
+METRICS_PREFIX = "downloader_"
+
+# 阶段耗时直方图的分桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_key(labels):
+    return ','.join(f"{k}={v}" for k, v in sorted(labels.items()))
+
+def _prom_labels(label_key, extra=None):
+    pairs = [pair.split('=', 1) for pair in label_key.split(',') if pair]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+class DownloadMetrics(StageTimer):
+    """
+    下载过程的计数器、直方图和实时量（在途请求、转换队列等）。
+    阶段耗时沿用 StageTimer.add，同时记进直方图；定期写成 JSON 快照和 Prometheus 文本文件，
+    webui 读 JSON 显示实时面板，Prometheus 可以用 node_exporter 的 textfile collector 采集。
+    """
+    def __init__(self):
+        super().__init__()
+        self.started = time.time()
+        self.counters = defaultdict(lambda: defaultdict(float))
+        self.histograms = defaultdict(dict)
+        self._gauges = {}
+        self.running = True
+
+    def add(self, stage, seconds, nbytes=0):
+        super().add(stage, seconds, nbytes)
+        self.observe('stage_seconds', seconds, stage=stage)
+        if nbytes:
+            self.inc('bytes_total', nbytes, stage=stage)
+
+    def inc(self, name, value=1, **labels):
+        self.counters[name][_label_key(labels)] += value
+
+    def observe(self, name, value, **labels):
+        key = _label_key(labels)
+        histogram = self.histograms[name].get(key)
+        if histogram is None:
+            histogram = self.histograms[name][key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, fn, label=None):
+        """注册一个实时量，快照时调用 fn 取值；给了 label 时 fn 返回 {标签值: 数值}"""
+        self._gauges[name] = (fn, label)
+
+    def total(self, name, **labels):
+        """某个计数器在满足 labels 的所有标签组合上的和"""
+        wanted = [f"{k}={v}" for k, v in labels.items()]
+        return sum(value for key, value in self.counters.get(name, {}).items()
+                   if all(pair in key.split(',') for pair in wanted))
+
+    def _gauge_values(self):
+        values = {}
+        for name, (fn, label) in self._gauges.items():
+            try:
+                result = fn()
+            except Exception:
+                continue
+            if label is None:
+                values[name] = {'': result}
+            else:
+                values[name] = {_label_key({label: k}): v for k, v in result.items()}
+        return values
+
+    def summary(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        network_bytes = self.total('bytes_total', stage='network')
+        return {
+            'posts': {result: int(self.total('posts_total', result=result))
+                      for result in ('downloaded', 'linked', 'skipped', 'failed')},
+            'requests': int(self.total('http_responses_total')),
+            'retries': int(self.total('retries_total')),
+            'bytes': int(network_bytes),
+            'bytes_per_s': network_bytes / elapsed,
+            'posts_per_s': self.total('posts_total', result='downloaded') / elapsed,
+        }
+
+    def snapshot(self):
+        return {
+            'updated_at': time.time(),
+            'elapsed': time.time() - self.started,
+            'running': self.running,
+            'summary': self.summary(),
+            'counters': {name: dict(values) for name, values in self.counters.items()},
+            'gauges': self._gauge_values(),
+            'histograms': {
+                name: {key: {'count': h.count, 'sum': h.sum, 'buckets': [[str(b), c] for b, c in h.cumulative()]}
+                       for key, h in values.items()}
+                for name, values in self.histograms.items()
+            },
+        }
+
+    def prometheus(self, snapshot=None):
+        snapshot = snapshot or self.snapshot()
+        lines = []
+        for name, values in snapshot['counters'].items():
+            lines.append(f"# TYPE {METRICS_PREFIX}{name} counter")
+            lines.extend(f"{METRICS_PREFIX}{name}{_prom_labels(key)} {value:g}" for key, value in values.items())
+        for name, values in snapshot['gauges'].items():
+            lines.append(f"# TYPE {METRICS_PREFIX}{name} gauge")
+            lines.extend(f"{METRICS_PREFIX}{name}{_prom_labels(key)} {value:g}" for key, value in values.items())
+        for name, values in snapshot['histograms'].items():
+            lines.append(f"# TYPE {METRICS_PREFIX}{name} histogram")
+            for key, h in values.items():
+                for bound, count in h['buckets']:
+                    lines.append(f"{METRICS_PREFIX}{name}_bucket{_prom_labels(key, ('le', bound))} {count}")
+                lines.append(f"{METRICS_PREFIX}{name}_sum{_prom_labels(key)} {h['sum']:g}")
+                lines.append(f"{METRICS_PREFIX}{name}_count{_prom_labels(key)} {h['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, base_dir):
+        """写 JSON 快照和 Prometheus 文本文件（先写临时文件再替换，读的一方不会读到半截）"""
+        base_dir = Path(base_dir)
+        snapshot = self.snapshot()
+        for filename, text in ((METRICS_JSON_FILENAME, json.dumps(snapshot, ensure_ascii=False)),
+                               (METRICS_PROM_FILENAME, self.prometheus(snapshot))):
+            path = base_dir / filename
+            tmp_path = path.with_name(path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            tmp_path.replace(path)
+
+    def progress_line(self):
+        s = self.summary()
+        posts = s['posts']
+        gauges = self._gauge_values()
+        in_flight = sum(gauges.get('http_in_flight', {}).values())
+        queued = sum(gauges.get('convert_queued', {}).values())
+        return (f"进度: 下载 {posts['downloaded']}, 链接 {posts['linked']}, 跳过 {posts['skipped']}, "
+                f"失败 {posts['failed']}, 重试 {s['retries']}, {s['bytes_per_s'] / 1024 / 1024:.2f} MB/秒, "
+                f"在途请求 {in_flight}, 转换排队 {queued}")
+
+    async def publish(self, base_dir, interval=5.0, progress=False):
+        """每隔 interval 秒写一次快照；progress=True 时同时打印一行汇总进度"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.write(base_dir)
+            except OSError as e:
+                print(f"写入下载指标失败: {e}")
+            if progress:
+                print(self.progress_line())
+
+def load_snapshot(base_dir):
+    """读取 JSON 快照，没有或读不了时返回None（给 webui 轮询用）"""
+    path = Path(base_dir) / METRICS_JSON_FILENAME
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
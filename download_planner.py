@@ -0,0 +1,101 @@
+import json
+import time
+from pathlib import Path
+
+PLAN_FILENAME = "download_plan.json"
+PLAN_VERSION = 1
+
+# 没有测过吞吐时按这个速度估算（字节/秒）
+DEFAULT_THROUGHPUT = 2 * 1024 * 1024
+
+def estimate_size(item, url, is_original):
+    """
+    估算要下载的字节数：原文件直接用 file_size；缩略版本 Danbooru 不给大小，
+    按像素比例从原文件大小缩放（PNG原图的JPEG缩略会偏大，只是估算）。
+    """
+    file_size = item.get('file_size') or 0
+    if is_original or not file_size:
+        return file_size
+    width, height = item.get('image_width'), item.get('image_height')
+    variants = (item.get('media_asset') or {}).get('variants') or []
+    variant = next((v for v in variants if v.get('url') == url), None)
+    if not variant or not width or not height or not variant.get('width') or not variant.get('height'):
+        return file_size
+    ratio = variant['width'] * variant['height'] / (width * height)
+    return int(file_size * min(1.0, ratio))
+
+def new_line_plan(line, search_tag):
+    return {
+        'search_tag': search_tag,
+        'listed': 0,        # 列表里看过的帖子数
+        'matched': 0,       # 通过过滤、计入名额的帖子数
+        'local': 0,         # 其中已经在本地清单里的
+        'bytes': 0,         # 需要下载的估算字节数
+        'next_page': None,  # 计划里的帖子用完后接着翻页的位置
+        'exhausted': False,
+        'error': False,
+        'items': [],
+    }
+
+def format_size(num_bytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1024 or unit == 'GB':
+            return f"{num_bytes:.1f} {unit}" if unit != 'B' else f"{num_bytes} B"
+        num_bytes /= 1024
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}秒"
+    if seconds < 3600:
+        return f"{seconds // 60}分{seconds % 60}秒"
+    return f"{seconds // 3600}小时{seconds % 3600 // 60}分"
+
+def write_plan(plan_path, lines, max_images, throughput):
+    plan = {
+        'version': PLAN_VERSION,
+        'created_at': time.time(),
+        'max_images': max_images,
+        'throughput': throughput,
+        'lines': lines,
+    }
+    plan_path = Path(plan_path)
+    tmp_path = plan_path.with_name(plan_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, ensure_ascii=False)
+    tmp_path.replace(plan_path)
+    return plan
+
+def load_plan(plan_path):
+    with open(plan_path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    if plan.get('version') != PLAN_VERSION:
+        raise ValueError(f"不支持的计划文件版本: {plan.get('version')}")
+    return plan
+
+def print_plan(plan, low_yield_ratio=0.2):
+    """按行打印：匹配数、本地已有、需下载、估算大小和用时，并标出低产出的行"""
+    throughput = plan['throughput'] or DEFAULT_THROUGHPUT
+    max_images = plan['max_images']
+    total_matched = total_local = total_bytes = 0
+    print(f"\n下载计划 (每行最多 {max_images} 个, 按 {format_size(throughput)}/秒 估算, "
+          f"本地已有 包含前面的行会下载的帖子):")
+    for line, entry in plan['lines'].items():
+        to_download = entry['matched'] - entry['local']
+        total_matched += entry['matched']
+        total_local += entry['local']
+        total_bytes += entry['bytes']
+        notes = []
+        if entry['error']:
+            notes.append('列表请求失败')
+        if entry['exhausted'] and entry['matched'] < max_images:
+            notes.append('结果不足')
+        if entry['listed'] and entry['matched'] / entry['listed'] < low_yield_ratio:
+            notes.append(f"过滤后只剩 {entry['matched']}/{entry['listed']}")
+        if entry['matched'] and not to_download:
+            notes.append('本地已全部存在')
+        note = f"  [{', '.join(notes)}]" if notes else ''
+        print(f"  {line}: 匹配 {entry['matched']}, 本地已有 {entry['local']}, 需下载 {to_download}, "
+              f"约 {format_size(entry['bytes'])}, 约 {format_eta(entry['bytes'] / throughput)}{note}")
+    print(f"合计: 匹配 {total_matched}, 本地已有 {total_local}, 需下载 {total_matched - total_local}, "
+          f"约 {format_size(total_bytes)}, 预计用时 {format_eta(total_bytes / throughput)}")
@@ -0,0 +1,1090 @@
+"""
+统一的 Danbooru 下载引擎。每个帖子依次经过:
+    列表(list) → 过滤(filter) → 下载(fetch) → 转换(transform) → 写标签(caption)
+并发、流式下载、断点续传、去重都只在这里实现一次；
+downloader_for_lora_train.py 和 downloader_for_lora_train_basic.py 只是两份不同的配置。
+"""
+import httpx
+import asyncio
+import aiofiles
+import os
+import re
+import time
+from pathlib import Path
+from PIL import UnidentifiedImageError
+from urllib.parse import quote
+import hashlib
+
+from download_manifest import DownloadManifest
+from download_journal import DownloadJournal
+from rate_limiter import AdaptiveHostLimiter, backoff_delay, RETRYABLE_STATUS
+from content_store import store_path, materialize
+from post_filter import PostFilter, GIF_EXTS
+from convert_pool import ConvertPool, transform_image, HAS_VIDEO_DECODER
+from http_clients import ClientPool
+from http_cache import HttpCache, HTTP_CACHE_FILENAME, DEFAULT_TTL
+from download_metrics import DownloadMetrics
+from captions import EXCLUDE_SYMBOLS, danbooru_caption, make_caption
+from post_metadata import PostMetadataStore
+from tag_preflight import (TAG_CACHE_FILENAME, DEFAULT_OVERSIZED, TagCache, split_line, assess_line,
+                           rank_lines, print_preflight)
+from danbooru_dump import DumpIndex
+from download_planner import (PLAN_FILENAME, estimate_size, new_line_plan,
+                              write_plan, load_plan, print_plan)
+
+# Danbooru 镜像地址，压测时指向本地的 benchmarks/mock_danbooru.py
+API_BASE = "https://kagamihara.donmai.us"
+
+# 每次列表请求的帖子数（Danbooru 允许的最大值）
+LIST_LIMIT = 200
+# 预检时一次 tags.json 请求查询的标签数
+TAG_LOOKUP_BATCH = 100
+
+async def stream_to_file(response, part_path, chunk_size=1024 * 1024):
+    """分块把响应体写入 part_path，同时计算md5，返回 (字节数, md5)"""
+    md5 = hashlib.md5()
+    size = 0
+    async with aiofiles.open(part_path, 'wb') as f:
+        async for chunk in response.aiter_bytes(chunk_size):
+            md5.update(chunk)
+            size += len(chunk)
+            await f.write(chunk)
+    return size, md5.hexdigest()
+
+# 静态图片才挑选缩略版本，动图/视频仍然下载原文件
+STATIC_IMAGE_EXTS = {'jpg', 'jpeg', 'png', 'webp', 'avif'}
+
+# 只要第一帧的动图/视频按这些位置分段请求(Range)，每段到手后尝试解码，解出来就不再下载剩下的部分
+FIRST_FRAME_RANGES = (256 * 1024, 1024 * 1024, 4 * 1024 * 1024)
+# 能从文件开头解出第一帧的视频格式（MP4 要求 moov 在前面，否则要下完才能解）
+PARTIAL_VIDEO_EXTS = {'mp4', 'webm'}
+
+def select_variant(item, min_side=None, min_pixels=None):
+    """
+    返回 (url, 扩展名, 是否原文件)。
+    未设置 min_side/min_pixels 时总是原文件；否则从 media_asset.variants 中挑满足
+    短边 >= min_side 且 像素数 >= min_pixels 的最小版本，同等大小优先JPEG，都不满足时用原文件。
+    """
+    media_asset = item.get('media_asset') or {}
+    variants = media_asset.get('variants') or []
+    original_variant = next((v for v in variants if v.get('type') == 'original'), None)
+    url = original_variant['url'] if original_variant else item.get('file_url')
+    ext = (original_variant or {}).get('file_ext') or item.get('file_ext') or os.path.splitext(url or '')[1].lstrip('.')
+    if not url or (min_side is None and min_pixels is None) or ext.lower() not in STATIC_IMAGE_EXTS:
+        return url, ext, True
+
+    candidates = []
+    for variant in variants:
+        width, height = variant.get('width'), variant.get('height')
+        if not variant.get('url') or not width or not height:
+            continue
+        if min_side is not None and min(width, height) < min_side:
+            continue
+        if min_pixels is not None and width * height < min_pixels:
+            continue
+        candidates.append(variant)
+    if not candidates:
+        return url, ext, True
+    best = min(candidates, key=lambda v: (v['width'] * v['height'], v.get('file_ext') != 'jpg'))
+    return best['url'], best.get('file_ext') or os.path.splitext(best['url'])[1].lstrip('.'), best.get('type') == 'original'
+
+class DownloadPipeline:
+    """
+    过滤/下载/转换/写标签各阶段的配置:
+    - post_filter: 下载前按元数据过滤 (post_filter.PostFilter)，None 不过滤
+    - min_side / min_pixels: 下载时挑选满足分辨率的最小版本，都为None下载原图
+    - download_videos / download_gifs: 是否下载视频/GIF并只保留第一帧
+    - transforms: 额外的转换步骤，见 convert_pool.TRANSFORMS，
+      例如 [('alpha_fill', {}), ('resize', {'max_side': 2048})]
+    - caption: item -> TXT标签内容，None 表示不写TXT
+    - link_mode: 仓库文件放进标签文件夹的方式，见 content_store.link_file
+    - timer: 记录各阶段耗时和计数 (download_metrics.DownloadMetrics)，None 不记录
+    - verbose: 是否每个文件都打印一行，文件很多时关掉，改看定期的汇总进度
+    - metadata: 保存完整帖子元数据的 post_metadata.PostMetadataStore，None 不保存
+    - range_first_frame: 动图/视频分段下载开头，解出第一帧就停止，见 fetch_first_frame
+    - dump: 本地 Danbooru 元数据索引 (danbooru_dump.DumpIndex)，能本地回答的行不请求 posts.json
+    """
+    def __init__(self, post_filter=None, min_side=None, min_pixels=None,
+                 download_videos=False, download_gifs=False, transforms=None,
+                 caption=danbooru_caption, convert_pool=None, timer=None, link_mode='hardlink',
+                 verbose=True, metadata=None, range_first_frame=True, dump=None):
+        self.post_filter = post_filter
+        self.min_side = min_side
+        self.min_pixels = min_pixels
+        self.download_videos = download_videos
+        self.download_gifs = download_gifs
+        self.transforms = [(name, dict(params or {})) for name, params in (transforms or [])]
+        self.caption = caption
+        self.convert_pool = convert_pool
+        self.timer = timer
+        self.link_mode = link_mode
+        self.verbose = verbose
+        self.metadata = metadata
+        self.range_first_frame = range_first_frame
+        self.dump = dump
+
+    def record(self, stage, seconds, nbytes=0):
+        if self.timer is not None:
+            self.timer.add(stage, seconds, nbytes)
+
+    def count(self, name, value=1, **labels):
+        if self.timer is not None:
+            self.timer.inc(name, value, **labels)
+
+    def save_metadata(self, item):
+        """保存完整的帖子元数据，之后改标签规则可以离线重新生成TXT"""
+        if self.metadata is not None:
+            self.metadata.add(item)
+
+    def log(self, message):
+        """每个文件一行的输出，verbose=False 时不打印"""
+        if self.verbose:
+            print(message)
+
+    def accept(self, item):
+        """过滤阶段：按元数据决定要不要下载"""
+        return self.post_filter is None or self.post_filter.accept(item)
+
+    def choose_variant(self, item):
+        """下载阶段：挑选要下载的版本，返回 (url, 扩展名, 是否原文件)"""
+        return select_variant(item, self.min_side, self.min_pixels)
+
+    async def transform(self, part_path, filename, kind):
+        """转换阶段：把下载好的 part_path 处理成最终文件，返回最终路径"""
+        first_frame = kind in ('video', 'gif')
+        if kind in ('video', 'gif') or filename.suffix.lower() == '.webp':
+            # 视频/GIF只保留第一帧，WebP统一转JPEG
+            final_filename = filename.with_suffix('.jpg')
+        elif self.transforms:
+            final_filename = filename
+        else:
+            # 不需要转换时直接原子重命名到最终位置
+            os.replace(part_path, filename)
+            return filename
+        # 解码/编码很吃CPU，放到进程池里做，不阻塞其它下载
+        if self.convert_pool is not None:
+            await self.convert_pool.transform(part_path, final_filename, self.transforms, first_frame)
+        else:
+            await asyncio.to_thread(transform_image, part_path, final_filename, self.transforms, first_frame)
+        return final_filename
+
+    async def write_caption(self, item, final_filename):
+        """写标签阶段：在图片旁边写同名TXT"""
+        if self.caption is None:
+            return None
+        text = self.caption(item)
+        if text is None:
+            return None
+        txt_filename = final_filename.with_suffix('.txt')
+        async with aiofiles.open(txt_filename, 'w', encoding='utf-8') as txt_file:
+            await txt_file.write(text)
+        return txt_filename
+
+def parse_content_range(value):
+    """'bytes 0-262143/5242880' -> 5242880，没有总长度时返回None"""
+    total = (value or '').rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+async def fetch_first_frame(session, url, filename, part_path, kind, pipeline, limiter):
+    """
+    动图/视频只保留第一帧，不需要整个文件：按 FIRST_FRAME_RANGES 分段请求开头，
+    每段到手后尝试转换，成功就返回最终文件，剩下的部分不再下载。
+    服务器忽略Range(返回200)时边下边在同样的位置尝试，成功后直接断开。
+    都解不出来时把剩余部分接着下完再转换，不会重新下载已有的部分。
+    返回最终路径；返回None表示这条路走不通(类型不对、状态码异常)，由调用方走普通的完整下载。
+    """
+    checkpoints = list(FIRST_FRAME_RANGES)
+    size = 0
+    total = None
+
+    async def try_transform():
+        try:
+            return await pipeline.transform(part_path, filename, kind)
+        except Exception:
+            # 数据还不够解出第一帧
+            return None
+
+    def finished(final_filename, how):
+        pipeline.count('first_frame_total', result=how)
+        if total:
+            pipeline.count('first_frame_saved_bytes', total - size)
+        return final_filename
+
+    open(part_path, 'wb').close()
+    while True:
+        end = f"{checkpoints[0] - 1}" if checkpoints else ''
+        async with limiter.slot(url):
+            started = time.perf_counter()
+            async with session.stream('GET', url, headers={'Range': f"bytes={size}-{end}"}) as response:
+                limiter.feedback(url, response.status_code, response.headers)
+                content_type = response.headers.get('Content-Type', '')
+                if response.status_code not in (200, 206) or not ('video' in content_type or 'image/gif' in content_type):
+                    return None
+                ranged = response.status_code == 206
+                if ranged:
+                    total = parse_content_range(response.headers.get('Content-Range')) or total
+                else:
+                    # 不支持Range，从头整个下载
+                    total = int(response.headers.get('Content-Length') or 0) or None
+                    size = 0
+                    open(part_path, 'wb').close()
+                received = 0
+                async with aiofiles.open(part_path, 'ab') as f:
+                    async for chunk in response.aiter_bytes(256 * 1024):
+                        await f.write(chunk)
+                        received += len(chunk)
+                        size += len(chunk)
+                        if not ranged and checkpoints and size >= checkpoints[0]:
+                            checkpoints.pop(0)
+                            await f.flush()
+                            final_filename = await try_transform()
+                            if final_filename:
+                                pipeline.record('network', time.perf_counter() - started, received)
+                                return finished(final_filename, 'partial')
+            pipeline.record('network', time.perf_counter() - started, received)
+        if not ranged or (total is not None and size >= total) or not checkpoints:
+            # 整个文件都在本地了
+            break
+        checkpoints.pop(0)
+        final_filename = await try_transform()
+        if final_filename:
+            return finished(final_filename, 'partial')
+    # 文件已完整，这次转换失败说明文件本身有问题，异常交给调用方处理
+    return finished(await pipeline.transform(part_path, filename, kind), 'full')
+
+async def download_image(session, item, filename, pipeline, limiter=None):
+    """成功返回最终文件路径；类型不需要、文件本身有问题或已不存在(404等)返回None；下载失败返回False(可稍后重试)"""
+    max_retries = 5
+    retries = 0
+    if limiter is None:
+        limiter = AdaptiveHostLimiter()
+    
+    url, ext, is_original = pipeline.choose_variant(item)
+    
+    if not url:
+        print(f"未找到原始文件URL: {item.get('id', '未知ID')}")
+        return None
+
+    if not is_original:
+        # 缩略版本的扩展名可能和原文件不同（例如 png 原图的 sample 是 jpg）
+        filename = filename.with_suffix(f".{ext}")
+
+    # 下载中的数据先写到 .part，完成后再重命名，中断时不会留下半截文件
+    part_path = filename.with_name(filename.name + '.part')
+
+    ext = ext.lower()
+    kind = 'gif' if ext in GIF_EXTS else 'video' if ext in PARTIAL_VIDEO_EXTS else None
+    if kind == 'gif' and not pipeline.download_gifs or kind == 'video' and not (pipeline.download_videos and HAS_VIDEO_DECODER):
+        # 不下载的类型交给下面按 Content-Type 跳过；没装 PyAV 时视频解不了，不分段
+        kind = None
+    if kind and is_original and pipeline.range_first_frame:
+        try:
+            final_filename = await fetch_first_frame(session, url, filename, part_path, kind, pipeline, limiter)
+        except UnidentifiedImageError:
+            print(f"文件损坏或无法解码，无法处理: {filename}")
+            return None
+        except Exception as e:
+            print(f"分段下载第一帧失败，改为完整下载: {e} - {url}")
+            final_filename = None
+        finally:
+            if part_path.exists():
+                os.remove(part_path)
+        if final_filename:
+            pipeline.log(f"提取第一帧完成: {final_filename}")
+            return final_filename
+
+    while retries < max_retries:
+        retry_after = None
+        try:
+            queued = time.perf_counter()
+            async with limiter.slot(url):
+                started = time.perf_counter()
+                async with session.stream('GET', url) as response:
+                    retry_after = limiter.feedback(url, response.status_code, response.headers)
+                    if response.status_code != 200:
+                        if response.status_code not in RETRYABLE_STATUS:
+                            # 404/403/410 等说明文件已删除或无权访问，重试也没用，让这一行换下一个帖子
+                            print(f"下载失败 (状态码 {response.status_code})，跳过: {url}")
+                            return None
+                        raise httpx.HTTPStatusError(
+                            f"状态码 {response.status_code}", request=response.request, response=response
+                        )
+                    content_type = response.headers.get('Content-Type', '')
+                    is_video = 'video' in content_type
+                    is_gif = 'image/gif' in content_type
+                    is_image = 'image' in content_type and not is_gif
+                    
+                    # 检查是否应该下载该类型文件，不需要的直接断开，不读响应体
+                    if is_video and not pipeline.download_videos:
+                        pipeline.log(f"跳过视频文件: {url}")
+                        return None
+                    if is_gif and not pipeline.download_gifs:
+                        pipeline.log(f"跳过GIF文件: {url}")
+                        return None
+                    if not (is_image or is_video or is_gif):
+                        print(f"跳过不支持的文件类型 ({content_type}): {url}")
+                        return None
+                    
+                    size, md5 = await stream_to_file(response, part_path)
+                pipeline.record('rate_limit_wait', started - queued)
+                pipeline.record('network', time.perf_counter() - started, size)
+
+            # md5 只对应原文件，缩略版本无法校验
+            expected_md5 = item.get('md5') if is_original else None
+            if expected_md5 and md5 != expected_md5:
+                raise ValueError(f"md5校验失败 (期望 {expected_md5}, 实际 {md5}, {size} 字节)")
+        except Exception as e:
+            if part_path.exists():
+                os.remove(part_path)
+            retries += 1
+            pipeline.count('retries_total', kind='media')
+            if retries < max_retries:
+                delay = backoff_delay(retries, retry_after)
+                print(f"下载异常 (尝试 {retries}/{max_retries}): {e} - {url}, {delay:.1f} 秒后重试")
+                await asyncio.sleep(delay)
+            else:
+                print(f"下载异常 (尝试 {retries}/{max_retries}): {e} - {url}")
+            continue
+
+        kind = 'video' if is_video else 'gif' if is_gif else 'image'
+        try:
+            final_filename = await pipeline.transform(part_path, filename, kind)
+            pipeline.log(f"{'保存图片' if kind == 'image' else '提取第一帧完成'}: {final_filename}")
+        except UnidentifiedImageError:
+            print(f"文件损坏或无法解码，无法处理: {filename}")
+            return None
+        except Exception as e:
+            print(f"文件处理异常: {e} - {filename}")
+            return None
+        finally:
+            if part_path.exists():
+                os.remove(part_path)
+        
+        # 视频和GIF只取了一帧，不生成TXT
+        if kind == 'image':
+            txt_filename = await pipeline.write_caption(item, final_filename)
+            if txt_filename:
+                pipeline.log(f"写入TXT标签: {txt_filename}")
+        
+        return final_filename
+    
+    # 单个帖子失败不再中断整个任务，由调用方记入日志稍后重试
+    print(f"放弃下载: {url}")
+    return False
+
+def line_to_folder_name(line):
+    keywords = [kw for kw in line.strip().split(' ') if kw]
+    processed_keywords_for_folder = []
+    for kw in keywords:
+        if kw in EXCLUDE_SYMBOLS:
+            processed_keywords_for_folder.append(kw)
+        else:
+            processed_keywords_for_folder.append(kw.replace('_', ' '))
+    folder_name_raw = ' '.join(processed_keywords_for_folder)
+    invalid_chars = r'[\\/:*?"<>|]'
+    return re.sub(invalid_chars, '_', folder_name_raw).replace(' ', '_')
+
+def line_to_search_tag(line):
+    keywords = [kw for kw in line.strip().split(' ') if kw]
+    processed_keywords_for_search = []
+    for kw in keywords:
+        if kw in EXCLUDE_SYMBOLS:
+            encoded_kw = quote(kw)
+        else:
+            encoded_kw = quote(kw)
+        processed_keywords_for_search.append(encoded_kw)
+    return '++'.join(processed_keywords_for_search)
+
+def first_page_param(line):
+    """带 order: 的搜索结果不是按id倒序，只能用数字翻页；其它都用 b<id> 游标翻页"""
+    return '1' if 'order:' in line else 'b'
+
+def next_page_param(page, data):
+    if page.startswith('b'):
+        return f"b{min(item['id'] for item in data)}"
+    return str(int(page) + 1)
+
+async def fetch_json(session, limiter, url, max_list_retries=5, timer=None, stage='listing'):
+    """请求一个 API 的 JSON，可重试的错误按退避重试；成功返回解析结果，最终失败返回None"""
+    list_retries = 0
+    while True:
+        try:
+            if session.is_cached(url):
+                # 缓存里没过期的页直接读本地，不占限速名额
+                response = await session.get(url)
+                if timer is not None:
+                    timer.add(f'{stage}_cached', 0)
+                return response.json()
+            async with limiter.slot(url):
+                started = time.perf_counter()
+                response = await session.get(url)
+            if timer is not None:
+                timer.add(stage, time.perf_counter() - started)
+            retry_after = limiter.feedback(url, response.status_code, response.headers)
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code not in RETRYABLE_STATUS or list_retries >= max_list_retries:
+                print(f"请求失败 (状态码 {response.status_code}): {url}")
+                return None
+            list_retries += 1
+            if timer is not None:
+                timer.inc('retries_total', kind=stage)
+            delay = backoff_delay(list_retries, retry_after)
+            print(f"请求失败 (状态码 {response.status_code}): {url}, {delay:.1f} 秒后重试 ({list_retries}/{max_list_retries})")
+        except Exception as e:
+            if list_retries >= max_list_retries:
+                print(f"请求异常: {e} - {url}")
+                return None
+            list_retries += 1
+            if timer is not None:
+                timer.inc('retries_total', kind=stage)
+            delay = backoff_delay(list_retries)
+            print(f"请求异常: {e} - {url}, {delay:.1f} 秒后重试 ({list_retries}/{max_list_retries})")
+        await asyncio.sleep(delay)
+
+async def fetch_listing(session, limiter, search_tag, page, max_list_retries=5, timer=None):
+    """请求一页 posts.json；成功返回列表，最终失败返回None"""
+    # page=b 表示从最新的开始，不带 page 参数
+    page_query = '' if page == 'b' else f"page={page}&"
+    url = f"{API_BASE}/posts.json?{page_query}limit={LIST_LIMIT}&tags={search_tag}"
+    return await fetch_json(session, limiter, url, max_list_retries=max_list_retries, timer=timer)
+
+async def list_page(session, limiter, line, page, pipeline, max_list_retries=5):
+    """列出一行的一页帖子：有本地元数据索引且能回答时查本地，否则请求 posts.json"""
+    if pipeline.dump is not None and pipeline.dump.supports(line):
+        started = time.perf_counter()
+        data = pipeline.dump.search(line, page, LIST_LIMIT)
+        pipeline.record('listing_local', time.perf_counter() - started)
+        return data
+    return await fetch_listing(session, limiter, line_to_search_tag(line), page, max_list_retries, pipeline.timer)
+
+async def preflight_lines(session, limiter, lines, tag_cache, max_images=5, oversized=DEFAULT_OVERSIZED, timer=None,
+                          dump=None):
+    """
+    下载前批量查每行的帖子数：先用 tags.json 一次查一批标签的帖子数，
+    多标签/带元标签的行再用 counts/posts.json 查整行的精确数量。结果存在 tag_cache 里，重复预检不联网。
+    有本地元数据索引(dump)时，能本地回答的行直接在本地数。
+    返回 {行: assess_line 的结果}
+    """
+    split = {line: split_line(line) for line in lines}
+    local = {line for line in lines if dump is not None and dump.supports(line)}
+    names = sorted({tag for line, (tags, _) in split.items() if line not in local for tag in tags})
+    tag_counts = tag_cache.get_tags(names)
+    for line in local:
+        tag_counts.update((tag, dump.tag_count(tag)) for tag in split[line][0])
+    missing = [name for name in names if name not in tag_counts]
+    for i in range(0, len(missing), TAG_LOOKUP_BATCH):
+        chunk = missing[i:i + TAG_LOOKUP_BATCH]
+        url = (f"{API_BASE}/tags.json?search[name_comma]={quote(','.join(chunk))}"
+               f"&only=name,post_count,category&limit={len(chunk)}")
+        data = await fetch_json(session, limiter, url, timer=timer, stage='preflight')
+        if data is None:
+            continue
+        found = {tag['name']: (tag['post_count'], tag.get('category')) for tag in data}
+        # 查不到的标签也记下来(帖子数0)，下次不用再查
+        records = [(name, *found.get(name, (0, None))) for name in chunk]
+        tag_cache.put_tags(records)
+        tag_counts.update((name, count) for name, count, _ in records)
+
+    async def search_count(line):
+        if line in local:
+            return dump.count(line)
+        tags, exact = split[line]
+        # 单个存在的标签，标签的帖子数就是结果数
+        if exact and tag_counts.get(tags[0]):
+            return None
+        search = ' '.join(line.split())
+        count = tag_cache.get_search(search)
+        if count is not None:
+            return count
+        url = f"{API_BASE}/counts/posts.json?tags={line_to_search_tag(line)}"
+        data = await fetch_json(session, limiter, url, timer=timer, stage='preflight')
+        # 搜索太复杂时 Danbooru 会返回 null
+        count = ((data or {}).get('counts') or {}).get('posts')
+        if count is not None:
+            tag_cache.put_search(search, count)
+        return count
+
+    counts = await asyncio.gather(*(search_count(line) for line in lines))
+    return {
+        line: assess_line(line, tag_counts, count, max_images, oversized)
+        for line, count in zip(lines, counts)
+    }
+
+async def process_line(session, line, line_number, base_save_dir, pipeline, max_images=5, 
+                      manifest=None, error_flag=None, limiter=None, max_concurrent_posts=4,
+                      journal=None, max_post_attempts=3, max_list_retries=5, planned=None):
+    stripped_line = line.strip()
+    save_dir = base_save_dir / line_to_folder_name(stripped_line)
+    
+    try:
+        save_dir.mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+        print(f"创建文件夹失败: {e} - {save_dir}")
+        error_flag['value'] = True
+        error_flag['lines'].append(line_number)
+        return
+    search_tag = line_to_search_tag(stripped_line)
+    print(f"构造搜索标签: {search_tag}")
+    
+    if limiter is None:
+        limiter = AdaptiveHostLimiter()
+    # 从日志恢复：上次完成到哪一页(游标)、已完成多少个
+    state = journal.line_state(stripped_line)
+    page = state['next_page'] or first_page_param(stripped_line)
+    # 以日志里实际完成的帖子为准，重新列出同一页时不会重复计数
+    processed_count = journal.done_count(stripped_line)
+    # 失败待重试的帖子先算进名额，重试阶段会补上
+    pending_failed = journal.pending_count(stripped_line)
+    if state['exhausted'] or processed_count + pending_failed >= max_images:
+        print(f"日志显示该行已完成: {search_tag} (已完成 {processed_count}, 待重试 {pending_failed})")
+        return
+    if page not in ('1', 'b') or processed_count:
+        print(f"从日志恢复: {search_tag} 页 {page}, 已完成 {processed_count}")
+    # 同一行内并发下载的帖子数
+    post_semaphore = asyncio.Semaphore(max_concurrent_posts)
+
+    async def fetch_one(item, unique_filename, md5):
+        async with post_semaphore:
+            unique_filename.parent.mkdir(parents=True, exist_ok=True)
+            final_filename = await download_image(session, item, unique_filename, pipeline, limiter)
+        if final_filename is None:
+            # 不需要的类型或文件本身有问题，重试也没用
+            manifest.release(md5)
+            journal.mark_skipped(stripped_line, md5)
+            pipeline.count('posts_total', result='skipped')
+            return None
+        if not final_filename:
+            # 释放占位，让其它行还有机会下载这个文件
+            manifest.release(md5)
+            journal.mark_failed(stripped_line, md5, item, unique_filename, max_post_attempts)
+            pipeline.count('posts_total', result='failed')
+            return False
+        manifest.add(md5, item.get('id'), final_filename, line=stripped_line)
+        journal.mark_done(stripped_line, md5)
+        materialize(final_filename, save_dir, pipeline.link_mode)
+        pipeline.save_metadata(item)
+        pipeline.count('posts_total', result='downloaded')
+        return True
+
+    async def link_existing(item, md5):
+        # 其它行正在下载同一个帖子时等它下完，然后直接链接过来
+        await manifest.wait_for(md5)
+        entry = manifest.get(md5)
+        if entry is None:
+            return None
+        if not entry['path'].exists():
+            print(f"清单中的文件已不存在: {entry['path']}, 下次运行重新下载")
+            manifest.forget(md5)
+            return None
+        pipeline.log(f"文件已存在: {md5}, 链接到 {save_dir.name}")
+        materialize(entry['path'], save_dir, pipeline.link_mode)
+        manifest.add_claim(md5, stripped_line)
+        journal.mark_done(stripped_line, md5)
+        # 以前下载的文件可能还没有元数据，这里顺便补上
+        pipeline.save_metadata(item)
+        pipeline.count('posts_total', result='linked')
+        return True
+
+    def start_listing(page):
+        return asyncio.create_task(list_page(session, limiter, stripped_line, page, pipeline, max_list_retries))
+
+    async def planned_listing():
+        return planned['items']
+
+    # 有计划文件且这一行还没开始过时，第一页直接用计划里列好的帖子，不重新请求列表
+    use_plan = planned is not None and state['next_page'] is None and not processed_count
+    if use_plan and not planned['items']:
+        use_plan = False
+        if planned['exhausted']:
+            print(f"计划显示没有可下载的文件: {search_tag}")
+            journal.save_line(stripped_line, page, processed_count, exhausted=True)
+            return
+        page = planned['next_page'] or page
+    if use_plan:
+        print(f"使用下载计划: {search_tag} ({len(planned['items'])} 个帖子)")
+    listing = asyncio.create_task(planned_listing()) if use_plan else start_listing(page)
+    try:
+        while processed_count + pending_failed < max_images:
+            data = await listing
+            listing = None
+            if data is None:
+                error_flag['value'] = True
+                error_flag['lines'].append(line_number)
+                return
+            if not data:
+                print(f"无更多文件可下载: {search_tag} (页 {page})")
+                journal.save_line(stripped_line, page, processed_count, exhausted=True)
+                break
+            next_page = next_page_param(page, data)
+            # 不满一页说明已经是最后一页，不用再多请求一次空页
+            last_page = len(data) < LIST_LIMIT
+            if use_plan:
+                # 计划里的帖子用完后从计划记录的位置接着翻页
+                next_page, last_page = planned['next_page'], planned['exhausted']
+                use_plan = False
+
+            pending = []
+            for item in data:
+                file_url = item.get('file_url', '')
+                if not file_url:
+                    print(f"跳过无文件URL的项目: {item.get('id', '未知ID')}")
+                    continue
+                # 按元数据过滤，不满足条件的帖子不发任何媒体请求
+                if not pipeline.accept(item):
+                    continue
+                
+                image_name = os.path.basename(file_url)
+                name_parts = os.path.splitext(image_name)
+                base_name = name_parts[0]
+                ext = name_parts[1].lower()
+                
+                md5 = item.get('md5') or base_name
+                # 已完成的已经计过数，失败的交给重试阶段，这里都不再重复处理
+                if journal.post_state(stripped_line, md5) in ('done', 'failed', 'gave_up', 'skipped'):
+                    continue
+                
+                # 文件只在仓库里存一份，标签文件夹里放链接
+                unique_filename = store_path(base_save_dir, md5, ext)
+                pending.append((item, unique_filename, md5))
+
+            # 本页候选不够填满名额时，下载本页的同时预取下一页
+            if not last_page and len(pending) < max_images - processed_count - pending_failed:
+                listing = start_listing(next_page)
+
+            while pending and processed_count + pending_failed < max_images:
+                # 每一波最多只发剩余需要的数量，保证不会超过 max_images
+                wave = []
+                while pending and len(wave) < max_images - processed_count - pending_failed:
+                    item, unique_filename, md5 = pending.pop(0)
+                    # 查清单并占位，避免并发的其它行重复下载同一个文件
+                    if not manifest.reserve(md5, item.get('id')):
+                        wave.append(link_existing(item, md5))
+                        continue
+                    wave.append(fetch_one(item, unique_filename, md5))
+                if wave:
+                    results = await asyncio.gather(*wave)
+                    processed_count += sum(1 for success in results if success)
+                    pending_failed += sum(1 for success in results if success is False)
+
+            # 整页处理完才推进游标，中途崩溃会重新列出这一页，已下载的会被清单跳过
+            # 名额已满但本页还有剩余时停在本页，之后调大 max_images 还能接着用
+            if pending:
+                journal.save_line(stripped_line, page, processed_count)
+                break
+            if last_page:
+                print(f"无更多文件可下载: {search_tag} (页 {page})")
+                journal.save_line(stripped_line, next_page, processed_count, exhausted=True)
+                break
+            journal.save_line(stripped_line, next_page, processed_count)
+            page = next_page
+            if listing is None and processed_count + pending_failed < max_images:
+                listing = start_listing(page)
+    finally:
+        # 名额提前满了，预取的下一页用不上
+        if listing is not None and not listing.done():
+            listing.cancel()
+
+async def plan_line(session, line, pipeline, max_images=5, manifest=None, limiter=None,
+                    max_list_retries=5, planned_md5s=None):
+    """
+    只请求列表，不下载：统计这一行会下载哪些帖子、本地已有多少、估算字节数。
+    planned_md5s 记录前面的行已经计划下载的md5，多行命中同一帖子时只算一次下载。
+    """
+    stripped_line = line.strip()
+    search_tag = line_to_search_tag(stripped_line)
+    entry = new_line_plan(stripped_line, search_tag)
+    if planned_md5s is None:
+        planned_md5s = set()
+    page = first_page_param(stripped_line)
+    while entry['matched'] < max_images:
+        data = await list_page(session, limiter, stripped_line, page, pipeline, max_list_retries)
+        if data is None:
+            entry['error'] = True
+            entry['next_page'] = page
+            break
+        if not data:
+            entry['exhausted'] = True
+            break
+        last_examined = None
+        for item in data:
+            last_examined = item
+            entry['listed'] += 1
+            file_url = item.get('file_url', '')
+            if not file_url or not pipeline.accept(item):
+                continue
+            md5 = item.get('md5') or os.path.splitext(os.path.basename(file_url))[0]
+            entry['matched'] += 1
+            entry['items'].append(item)
+            if md5 in planned_md5s or manifest.has(md5, item.get('id')):
+                entry['local'] += 1
+            else:
+                planned_md5s.add(md5)
+                url, ext, is_original = pipeline.choose_variant(item)
+                entry['bytes'] += estimate_size(item, url, is_original)
+            if entry['matched'] >= max_images:
+                break
+        consumed_all = last_examined is data[-1]
+        # 游标翻页从最后看过的帖子之后接着列；数字翻页只能跳到下一页
+        entry['next_page'] = f"b{last_examined['id']}" if page.startswith('b') else next_page_param(page, data)
+        if consumed_all and len(data) < LIST_LIMIT:
+            entry['exhausted'] = True
+            break
+        page = entry['next_page']
+    print(f"计划: {search_tag} 看过 {entry['listed']}, 匹配 {entry['matched']}, 本地已有 {entry['local']}")
+    return entry
+
+async def retry_failed_posts(session, manifest, journal, error_flag, pipeline, max_post_attempts=3,
+                             limiter=None, max_concurrent_posts=4, base_save_dir=None):
+    """重试日志中记为失败的帖子，不需要重新翻页"""
+    failed = journal.failed_posts()
+    if not failed:
+        return 0
+    print(f"\n开始重试失败的帖子: {len(failed)} 个")
+    semaphore = asyncio.Semaphore(max_concurrent_posts)
+
+    async def retry_one(entry):
+        md5 = entry['md5']
+        save_dir = base_save_dir / line_to_folder_name(entry['line'])
+        async with semaphore:
+            if not manifest.reserve(md5, entry['item'].get('id')):
+                # 其它行已经下到了
+                await manifest.wait_for(md5)
+                existing = manifest.get(md5)
+                if existing is None or not existing['path'].exists():
+                    return False
+                materialize(existing['path'], save_dir, pipeline.link_mode)
+                manifest.add_claim(md5, entry['line'])
+                journal.mark_done(entry['line'], md5)
+                journal.add_processed(entry['line'])
+                pipeline.save_metadata(entry['item'])
+                pipeline.count('posts_total', result='linked')
+                return True
+            filename = entry['filename']
+            filename.parent.mkdir(parents=True, exist_ok=True)
+            final_filename = await download_image(session, entry['item'], filename, pipeline, limiter)
+        if final_filename is None:
+            manifest.release(md5)
+            journal.mark_skipped(entry['line'], md5)
+            pipeline.count('posts_total', result='skipped')
+            return False
+        if not final_filename:
+            manifest.release(md5)
+            pipeline.count('posts_total', result='failed')
+            state = journal.mark_failed(entry['line'], md5, entry['item'], filename, max_post_attempts)
+            if state == 'gave_up':
+                print(f"重试{max_post_attempts}次仍失败，放弃: {md5}")
+            return False
+        manifest.add(md5, entry['item'].get('id'), final_filename, line=entry['line'])
+        journal.mark_done(entry['line'], md5)
+        journal.add_processed(entry['line'])
+        materialize(final_filename, save_dir, pipeline.link_mode)
+        pipeline.save_metadata(entry['item'])
+        pipeline.count('posts_total', result='downloaded')
+        return True
+
+    results = await asyncio.gather(*(retry_one(entry) for entry in failed))
+    succeeded = sum(1 for success in results if success)
+    print(f"重试完成: 成功 {succeeded}, 失败 {len(failed) - succeeded}")
+    return succeeded
+
+async def main(txt_path, save_dir="downloaded_images", timeout=1000, proxies=None, 
+              start_line=1, max_lines_per_batch=5, max_images=5,
+              download_videos=False, download_gifs=False,
+              max_concurrent_posts=4, max_in_flight=16, max_per_host=8,
+              resume=True, max_rounds=3, max_post_attempts=3, host_rates=None,
+              min_side=None, min_pixels=None, link_mode='hardlink',
+              filter_rules=None, convert_workers=None, transforms=None, write_captions=True,
+              plan_only=False, plan_path=None, http2=False, client_config=None,
+              http_cache_path=HTTP_CACHE_FILENAME, cache_ttl=DEFAULT_TTL,
+              verbose=True, metrics_interval=5.0, caption_rules=None, save_metadata=True,
+              range_first_frame=True, preflight=False, order_by_yield=False, skip_empty_lines=True,
+              oversized_threshold=DEFAULT_OVERSIZED, tag_cache_path=TAG_CACHE_FILENAME, dump_path=None):
+    print("开始执行脚本...")
+    print(f"当前工作目录: {os.getcwd()}")
+    print(f"尝试打开文件: {txt_path}")
+    print(f"下载设置 - 视频: {download_videos}, GIF: {download_gifs}, 最小短边: {min_side}, 最小像素: {min_pixels}")
+    print(f"并发设置 - 行: {max_lines_per_batch}, 每行帖子: {max_concurrent_posts}, "
+          f"全局在途: {max_in_flight}, 每host: {max_per_host}")
+
+    # 列表API和媒体CDN各用一个客户端，媒体的连接数跟全局在途数一致
+    config = {'media': {'max_connections': max_in_flight, 'max_keepalive_connections': max_in_flight}}
+    for name, options in (client_config or {}).items():
+        config.setdefault(name, {}).update(options)
+    # 列表页缓存在磁盘上，同一个标签文件反复跑时列表基本不走网络
+    cache = HttpCache(http_cache_path, ttl=cache_ttl) if http_cache_path else None
+    # 各阶段耗时、请求/字节/状态码/重试计数，定期写到保存目录供 webui 和 Prometheus 读取
+    timer = DownloadMetrics()
+    async with ClientPool(proxies=proxies, timeout=timeout, config=config, http2=http2, cache=cache,
+                          metrics=timer) as session:
+        # (文件里的行号, 行)，预检后可能被过滤和重新排序
+        numbered_lines = []
+        try:
+            async with aiofiles.open(txt_path, mode='r', encoding='utf-8') as file:
+                line_number = 0
+                while True:
+                    line = await file.readline()
+                    if not line:
+                        break
+                    line_number += 1
+                    stripped_line = line.strip()
+                    if line_number >= start_line and stripped_line:
+                        numbered_lines.append((line_number, stripped_line))
+            print(f"成功读取文件: {txt_path}, 有效行数: {len(numbered_lines)} (从第{start_line}行开始)")
+        except FileNotFoundError:
+            print(f"错误: 文件 {txt_path} 不存在.")
+            return None
+        except UnicodeDecodeError:
+            print(f"错误: 文件 {txt_path} 编码不是UTF-8，请转换为UTF-8后重试.")
+            return None
+        
+        base_save_dir = Path(save_dir)
+        base_save_dir.mkdir(parents=True, exist_ok=True)
+        print(f"创建/检查基础保存目录: {base_save_dir}")
+
+        manifest = DownloadManifest(base_save_dir)
+        imported = manifest.import_existing()
+        if imported:
+            print(f"已从旧目录迁移文件到下载清单: {imported}")
+        print(f"下载清单中的文件数: {len(manifest)}")
+
+        limiter = AdaptiveHostLimiter(max_in_flight=max_in_flight, max_per_host=max_per_host, host_rates=host_rates)
+        # 本地元数据索引（danbooru_dump.py 导入），能本地回答的行不请求列表
+        dump = None
+        if dump_path is not None:
+            if not Path(dump_path).exists():
+                print(f"错误: 元数据索引 {dump_path} 不存在，先用 danbooru_dump.py 导入")
+                manifest.close()
+                return None
+            dump = DumpIndex(dump_path)
+            local = sum(1 for _, line in numbered_lines if dump.supports(line))
+            print(f"使用本地元数据索引: {dump_path} ({len(dump)} 个帖子), 本地回答 {local}/{len(numbered_lines)} 行")
+        if preflight:
+            # 先批量查每行的帖子数，没有结果的行不用建文件夹和翻页
+            with TagCache(tag_cache_path) as tag_cache:
+                results = await preflight_lines(
+                    session, limiter, list(dict.fromkeys(line for _, line in numbered_lines)), tag_cache,
+                    max_images=max_images, oversized=oversized_threshold, timer=timer, dump=dump
+                )
+            print_preflight(numbered_lines, results, max_images)
+            if skip_empty_lines:
+                skipped = [n for n, line in numbered_lines if 'empty' in results[line]['flags']]
+                if skipped:
+                    print(f"跳过没有结果的行: {', '.join(map(str, skipped))}")
+                numbered_lines = [(n, line) for n, line in numbered_lines if 'empty' not in results[line]['flags']]
+            if order_by_yield:
+                # 预计产出多的行先跑
+                numbered_lines = rank_lines(numbered_lines, results)
+        lines = [line for _, line in numbered_lines]
+
+        if plan_only:
+            if plan_path is None:
+                plan_path = base_save_dir / PLAN_FILENAME
+            # 只请求列表，生成计划文件，不下载
+            pipeline = DownloadPipeline(
+                post_filter=PostFilter(filter_rules, download_videos=download_videos, download_gifs=download_gifs),
+                min_side=min_side, min_pixels=min_pixels, dump=dump
+            )
+            planned_md5s = set()
+            plan_lines = {}
+            try:
+                # 逐行规划，多行命中同一帖子时按行的顺序只算一次下载
+                for line in lines:
+                    plan_lines[line] = await plan_line(
+                        session, line, pipeline, max_images=max_images, manifest=manifest,
+                        limiter=limiter, planned_md5s=planned_md5s
+                    )
+                throughput = float(manifest.get_meta('throughput', 0)) or None
+            finally:
+                manifest.close()
+                if dump is not None:
+                    dump.close()
+            plan = write_plan(plan_path, plan_lines, max_images, throughput)
+            print_plan(plan)
+            pipeline.post_filter.report()
+            print(f"\n计划已写入: {plan_path}，设置 plan_path 并把 plan_only 改成 False 后运行即按计划下载")
+            return None
+
+        plan = None
+        if plan_path is not None:
+            plan = load_plan(plan_path)
+            print(f"读取下载计划: {plan_path} ({len(plan['lines'])} 行)")
+        
+        journal = DownloadJournal(base_save_dir)
+        if not resume:
+            journal.reset()
+            print("已清空断点日志，从头开始")
+
+        # 不下载视频/GIF时也在这里按扩展名过滤掉，不用下载完才发现
+        post_filter = PostFilter(filter_rules, download_videos=download_videos, download_gifs=download_gifs)
+        run_started = time.perf_counter()
+        # 转换用的进程池，None 表示按CPU核数
+        convert_pool = ConvertPool(max_workers=convert_workers, timer=timer)
+        metadata = PostMetadataStore(base_save_dir) if save_metadata else None
+        pipeline = DownloadPipeline(
+            post_filter=post_filter, min_side=min_side, min_pixels=min_pixels,
+            download_videos=download_videos, download_gifs=download_gifs,
+            transforms=transforms, caption=make_caption(caption_rules) if write_captions else None,
+            convert_pool=convert_pool, timer=timer, link_mode=link_mode, verbose=verbose,
+            metadata=metadata, range_first_frame=range_first_frame, dump=dump
+        )
+        # max_lines_per_batch 作为同时处理的行数（滑动窗口，而不是一批批等齐）
+        line_semaphore = asyncio.Semaphore(max_lines_per_batch)
+        line_counts = {'waiting': 0, 'running': 0}
+
+        async def run_line(current_line_number, line, error_flag):
+            line_counts['waiting'] += 1
+            async with line_semaphore:
+                line_counts['waiting'] -= 1
+                line_counts['running'] += 1
+                print(f"\n处理第 {current_line_number} 行: {line}")
+                try:
+                    await process_line(
+                        session, line, current_line_number, base_save_dir, pipeline,
+                        max_images=max_images, manifest=manifest, 
+                        error_flag=error_flag, limiter=limiter,
+                        max_concurrent_posts=max_concurrent_posts,
+                        journal=journal, max_post_attempts=max_post_attempts,
+                        planned=plan['lines'].get(line) if plan else None
+                    )
+                finally:
+                    line_counts['running'] -= 1
+
+        # 队列深度、在途请求等实时量，写快照时读取
+        timer.gauge('http_in_flight', limiter.in_flight, label='host')
+        timer.gauge('host_concurrency_limit', limiter.limits, label='host')
+        timer.gauge('convert_queued', lambda: convert_pool.queued)
+        timer.gauge('convert_running', lambda: convert_pool.running)
+        timer.gauge('lines', lambda: dict(line_counts), label='state')
+        publisher = None
+        if metrics_interval:
+            publisher = asyncio.create_task(timer.publish(base_save_dir, metrics_interval, progress=not verbose))
+
+        # max_rounds 包括第一轮，小于1时也至少把每行跑一遍
+        max_rounds = max(1, max_rounds)
+        error_flag = {'value': False, 'lines': []}
+        short_lines = []
+        try:
+            # 一行出错不影响其它行；出错的行和失败的帖子在下一轮从日志记录的位置继续
+            for round_index in range(1, max_rounds + 1):
+                error_flag = {'value': False, 'lines': []}
+                await asyncio.gather(*(
+                    run_line(current_line_number, line, error_flag)
+                    for current_line_number, line in numbered_lines
+                ))
+                await retry_failed_posts(
+                    session, manifest, journal, error_flag, pipeline,
+                    max_post_attempts=max_post_attempts,
+                    limiter=limiter, max_concurrent_posts=max_concurrent_posts,
+                    base_save_dir=base_save_dir
+                )
+                # 放弃或跳过的帖子让出了名额，没下满也没翻完的行下一轮接着翻页补上
+                short_lines = [
+                    n for n, line in numbered_lines
+                    if not journal.line_state(line)['exhausted']
+                    and journal.done_count(line) + journal.pending_count(line) < max_images
+                ]
+                if not error_flag['value'] and not journal.failed_posts() and not short_lines:
+                    break
+                if round_index < max_rounds:
+                    if short_lines:
+                        print(f"\n第 {round_index} 轮有帖子放弃，未下满的行: {', '.join(map(str, short_lines))}，"
+                              f"开始第 {round_index + 1} 轮")
+                    else:
+                        print(f"\n第 {round_index} 轮存在失败，开始第 {round_index + 1} 轮")
+        finally:
+            # 记下这次的实际吞吐，规划时用来估算用时
+            elapsed = time.perf_counter() - run_started
+            if timer.bytes['network'] and elapsed > 0:
+                manifest.set_meta('throughput', timer.bytes['network'] / elapsed)
+            if publisher is not None:
+                publisher.cancel()
+                timer.running = False
+                try:
+                    timer.write(base_save_dir)
+                except OSError as e:
+                    print(f"写入下载指标失败: {e}")
+            manifest.close()
+            journal.close()
+            convert_pool.close()
+            if metadata is not None:
+                metadata.close()
+            if dump is not None:
+                dump.close()
+        post_filter.report()
+        timer.report(time.perf_counter() - run_started)
+        session.report()
+        if short_lines and not error_flag['value']:
+            print(f"\n{max_rounds} 轮后仍未下满的行: {', '.join(map(str, short_lines))}，再次运行会接着补")
+        if error_flag['value']:
+            error_lines = sorted(set(error_flag['lines']))
+            print(f"\n检测到下载异常，停止脚本。出错的行号: {', '.join(map(str, error_lines))}")
+            return min(error_lines)
+    print("\n所有标签处理完成！")
+    return None
+
+async def run_downloader(txt_path, save_dir, timeout=5000, proxies=None, max_lines_per_batch=5, max_images=50, start_line=1, download_videos=False, download_gifs=False,
+                         max_concurrent_posts=4, max_in_flight=16, max_per_host=8,
+                         resume=True, max_rounds=3, max_post_attempts=3, host_rates=None,
+                         min_side=None, min_pixels=None, link_mode='hardlink',
+                         filter_rules=None, convert_workers=None, transforms=None, write_captions=True,
+                         plan_only=False, plan_path=None, http2=False, client_config=None,
+                         http_cache_path=HTTP_CACHE_FILENAME, cache_ttl=DEFAULT_TTL,
+                         verbose=True, metrics_interval=5.0, caption_rules=None, save_metadata=True,
+                         range_first_frame=True, preflight=False, order_by_yield=False, skip_empty_lines=True,
+                         oversized_threshold=DEFAULT_OVERSIZED, tag_cache_path=TAG_CACHE_FILENAME, dump_path=None):
+    while True:
+        result = await main(
+            txt_path=txt_path,
+            save_dir=save_dir,
+            timeout=timeout,
+            proxies=proxies,
+            start_line=start_line,
+            max_lines_per_batch=max_lines_per_batch,
+            max_images=max_images,
+            download_videos=download_videos,
+            download_gifs=download_gifs,
+            max_concurrent_posts=max_concurrent_posts,
+            max_in_flight=max_in_flight,
+            max_per_host=max_per_host,
+            resume=resume,
+            max_rounds=max_rounds,
+            max_post_attempts=max_post_attempts,
+            host_rates=host_rates,
+            min_side=min_side,
+            min_pixels=min_pixels,
+            link_mode=link_mode,
+            filter_rules=filter_rules,
+            convert_workers=convert_workers,
+            transforms=transforms,
+            write_captions=write_captions,
+            plan_only=plan_only,
+            plan_path=plan_path,
+            http2=http2,
+            client_config=client_config,
+            http_cache_path=http_cache_path,
+            cache_ttl=cache_ttl,
+            verbose=verbose,
+            metrics_interval=metrics_interval,
+            caption_rules=caption_rules,
+            save_metadata=save_metadata,
+            range_first_frame=range_first_frame,
+            preflight=preflight,
+            order_by_yield=order_by_yield,
+            skip_empty_lines=skip_empty_lines,
+            oversized_threshold=oversized_threshold,
+            tag_cache_path=tag_cache_path,
+            dump_path=dump_path
+        )
+        # 重启时必须沿用日志，否则会从头翻页
+        resume = True
+        if result is None:
+            break
+        else:
+            start_line = result
+        
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            total_lines = sum(1 for line in f if line.strip())
+        if start_line > total_lines:
+            print(f"\n已处理完所有 {total_lines} 个有效标签，退出脚本。")
+            break
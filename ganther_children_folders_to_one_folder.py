@@ -1,28 +1,65 @@
+import filecmp
+import fnmatch
 import os
 import shutil
 from pathlib import Path
 
+# 下载器在保存目录里留下的清单/日志/元数据等文件，不是训练数据，合并时留在原处
+# 以 . 开头的目录和文件(.store 文件仓库、.phash_cache.sqlite 等)也都跳过
+DOWNLOADER_SIDECARS = ['*.sqlite', '*.sqlite-wal', '*.sqlite-shm', 'post_metadata.jsonl.gz',
+                       'download_plan.json', 'download_metrics.*']
+
+def is_sidecar(name):
+    return name.startswith('.') or any(fnmatch.fnmatch(name, pattern) for pattern in DOWNLOADER_SIDECARS)
+
+def same_file(a, b):
+    return os.path.exists(b) and filecmp.cmp(a, b, shallow=False)
+
+def move_group(paths, target_dir, stem):
+    """
+    把同名(不同扩展名)的一组文件(图片和它的TXT等)一起移动，重名时整组用同一个 (n) 后缀。
+    目标里已有整组完全相同的文件时(同一个帖子在多个标签文件夹里)，直接删掉这一组，只保留一份。
+    """
+    counter = 0
+    while True:
+        name = stem if counter == 0 else f"{stem}({counter})"
+        targets = [os.path.join(target_dir, name + os.path.splitext(path)[1]) for path in paths]
+        if all(same_file(path, target) for path, target in zip(paths, targets)):
+            for path in paths:
+                os.remove(path)
+                print(f"重复文件，已删除: {path}")
+            return
+        if not any(os.path.exists(target) for target in targets):
+            break
+        counter += 1
+    for path, target in zip(paths, targets):
+        try:
+            if os.path.islink(path):
+                # 下载器在不支持硬链接时用相对路径的符号链接，移动后会失效，换成真实文件
+                shutil.copy2(os.path.realpath(path), target)
+                os.remove(path)
+            else:
+                shutil.move(path, target)
+            print(f"已移动: {path} -> {target}")
+        except Exception as e:
+            print(f"移动文件时出错 {path}: {str(e)}")
+
 def move_files_from_subfolders(source_dir, target_dir):
     # 确保目标文件夹存在，如果不存在则创建
     Path(target_dir).mkdir(parents=True, exist_ok=True)
+    groups = {}
     for item in os.listdir(source_dir):
+        if is_sidecar(item):
+            continue
         item_path = os.path.join(source_dir, item)
         if os.path.isdir(item_path):
             if item_path == target_dir:
                 continue
             move_files_from_subfolders(item_path, target_dir)
         elif os.path.isfile(item_path):
-            target_file_path = os.path.join(target_dir, item)
-            counter = 1
-            while os.path.exists(target_file_path):
-                file_name, file_ext = os.path.splitext(item)
-                target_file_path = os.path.join(target_dir, f"{file_name}({counter}){file_ext}")
-                counter += 1
-            try:
-                shutil.move(item_path, target_file_path)
-                print(f"已移动: {item_path} -> {target_file_path}")
-            except Exception as e:
-                print(f"移动文件时出错 {item_path}: {str(e)}")
+            groups.setdefault(os.path.splitext(item)[0], []).append(item_path)
+    for stem, paths in groups.items():
+        move_group(sorted(paths), target_dir, stem)
 
 if __name__ == "__main__":
     # 修改为你的源文件夹路径
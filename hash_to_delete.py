@@ -1,15 +1,8 @@
 import os
-import imagehash
+import contextlib
 from PIL import Image
 from collections import defaultdict
-
-def get_image_phash(image_path):
-    try:
-        with Image.open(image_path) as img:
-            return imagehash.phash(img)
-    except Exception as e:
-        print(f"无法处理图片 {image_path}: {e}")
-        return None
+from phash_dedup import group_similar_hashes, hash_images, PhashCache
 
 def get_image_resolution(image_path):
     try:
@@ -19,42 +12,41 @@ def get_image_resolution(image_path):
         print(f"无法获取图片分辨率 {image_path}: {e}")
         return 0
 
-def hamming_distance(hash1, hash2):
-    return hash1 - hash2
+def print_hash_progress(done, total):
+    if done == total or done % 500 == 0:
+        print(f"计算哈希: {done}/{total}")
 
-def group_similar_images(directory, threshold=5):
+def group_similar_images(directory, threshold=5, workers=None, progress=print_hash_progress, use_cache=True,
+                         hash_size=8, resolutions=None):
+    """resolutions: 传入字典时填上每张图的像素数(算哈希时顺便得到)，交给 process_similar_groups 就不用再打开图片"""
     image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff'}
-    image_hashes = {}
+    image_paths = []
     for filename in os.listdir(directory):
         file_path = os.path.join(directory, filename)
         ext = os.path.splitext(filename)[1].lower()
         
         if ext in image_extensions and os.path.isfile(file_path):
-            phash = get_image_phash(file_path)
-            if phash:
-                image_hashes[file_path] = phash
-    
-    groups = []
-    processed = set()
-    
-    for path1, hash1 in image_hashes.items():
-        if path1 in processed:
-            continue
-            
-        group = [path1]
-        processed.add(path1)
-        
-        for path2, hash2 in image_hashes.items():
-            if path2 not in processed and hamming_distance(hash1, hash2) <= threshold:
-                group.append(path2)
-                processed.add(path2)
-        
-        if len(group) > 1:
-            groups.append(group)
+            image_paths.append(file_path)
+
+    # 哈希在多个进程里并行算，结果按文件顺序返回；没变过的图片直接用文件夹里的缓存
+    with PhashCache(directory, hash_size) if use_cache else contextlib.nullcontext() as cache:
+        image_hashes = dict(hash_images(
+            image_paths, workers=workers, progress=progress, cache=cache, hash_size=hash_size,
+            resolutions=resolutions, on_error=lambda path, e: print(f"无法处理图片 {path}: {e}")
+        ))
+        if cache is not None:
+            cache.prune(image_paths)
+            print(f"哈希缓存: 命中 {cache.hits}, 重新计算 {cache.misses}")
     
-    return groups
+    # 哈希打包成 uint64 数组分块比较（数量很多时用汉明距离索引），分组结果和原来一样
+    return group_similar_hashes(image_hashes, threshold)
+
+def process_similar_groups(groups, delete_files=False, delete_txt_files=False, resolutions=None):
+    def resolution_of(file_path):
+        if resolutions and file_path in resolutions:
+            return resolutions[file_path]
+        return get_image_resolution(file_path)
 
-def process_similar_groups(groups, delete_files=False, delete_txt_files=False):
     if not groups:
         print("未发现相似图片组")
         return
@@ -74,7 +66,7 @@ def process_similar_groups(groups, delete_files=False, delete_txt_files=False):
                 has_txt.append({
                     'image_path': file_path,
                     'txt_path': txt_path,
-                    'resolution': get_image_resolution(file_path)
+                    'resolution': resolution_of(file_path)
                 })
                 print(f"[有TXT] {os.path.basename(file_path)} - 分辨率: {has_txt[-1]['resolution']} 像素")
             else:
@@ -95,7 +87,7 @@ def process_similar_groups(groups, delete_files=False, delete_txt_files=False):
                             print(f"删除 {os.path.basename(file_path)} 失败: {e}")
             else:
                 if no_txt and len(no_txt) > 1:
-                    no_txt_sorted = sorted(no_txt, key=lambda x: get_image_resolution(x), reverse=True)
+                    no_txt_sorted = sorted(no_txt, key=resolution_of, reverse=True)
                     to_keep = no_txt_sorted[0]
                     to_delete = no_txt_sorted[1:]
                     
@@ -134,6 +126,7 @@ def process_similar_groups(groups, delete_files=False, delete_txt_files=False):
 
 if __name__ == "__main__":
     target_directory = "emilia"  # 替换为实际目录
+    hash_size = 8  # 8 为64位哈希；16 为256位，更精细，阈值大约放大到4倍
     
     if not os.path.isdir(target_directory):
         print(f"错误: 目录 '{target_directory}' 不存在")
@@ -144,8 +137,10 @@ if __name__ == "__main__":
             threshold = int(threshold_input)
             
             print(f"正在分析目录: {target_directory}，请稍候...")
-            similar_groups = group_similar_images(target_directory, threshold)
-            process_similar_groups(similar_groups, delete_files=False, delete_txt_files=False)
+            resolutions = {}
+            similar_groups = group_similar_images(target_directory, threshold, hash_size=hash_size,
+                                                  resolutions=resolutions)
+            process_similar_groups(similar_groups, delete_files=False, delete_txt_files=False, resolutions=resolutions)
 
             delete_choice = input("\n是否删除无TXT的重复文件？(y/n): ").strip().lower()
             delete_files = (delete_choice == 'y')
@@ -158,7 +153,7 @@ if __name__ == "__main__":
             if delete_files or delete_txt_files:
                 confirm = input("确定要执行删除操作吗？这将永久删除文件！(y/n): ").strip().lower()
                 if confirm == 'y':
-                    process_similar_groups(similar_groups, delete_files, delete_txt_files)
+                    process_similar_groups(similar_groups, delete_files, delete_txt_files, resolutions=resolutions)
                 else:
                     print("已取消删除操作")
             else:
@@ -0,0 +1,189 @@
+import json
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+# 默认放在当前目录，下载器和 saucenao 共用同一个缓存文件
+HTTP_CACHE_FILENAME = "http_cache.sqlite"
+
+# 缓存多久内直接用本地结果（秒），过期后带 ETag/Last-Modified 重新验证，没变化服务器只回304
+DEFAULT_TTL = 3600
+
+# 缓存总大小上限（压缩后的字节数），超过后按最近使用时间淘汰
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# 不进缓存键的参数，避免把 API Key 写进缓存文件
+SECRET_PARAMS = {'api_key', 'login'}
+
+# 响应体存的是解压后的内容，这些头不再适用
+DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive'}
+
+def cache_key(url):
+    parts = urlsplit(str(url))
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ''))
+
+class HttpCache:
+    """
+    按URL缓存GET响应（SQLite，响应体zlib压缩）。
+    TTL内直接返回本地结果；过期后带 If-None-Match/If-Modified-Since 重新验证；
+    总大小超过 max_bytes 时按最近使用时间(LRU)淘汰。
+    """
+    def __init__(self, path=HTTP_CACHE_FILENAME, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                size INTEGER,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL,
+                last_access REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+        """)
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evicted': 0}
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _fresh(self, stored_at, ttl):
+        # 有效期按当前设置算，改小 ttl 后旧条目马上生效
+        return stored_at + (self.ttl if ttl is None else ttl) > time.time()
+
+    def get(self, key, ttl=None):
+        row = self._conn.execute(
+            "SELECT status, headers, body, etag, last_modified, stored_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        return {
+            'status': row[0], 'headers': json.loads(row[1]), 'body': zlib.decompress(row[2]),
+            'etag': row[3], 'last_modified': row[4], 'fresh': self._fresh(row[5], ttl),
+        }
+
+    def is_fresh(self, key, ttl=None):
+        row = self._conn.execute("SELECT stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return bool(row) and self._fresh(row[0], ttl)
+
+    def put(self, key, status, headers, body):
+        data = zlib.compress(body)
+        now = time.time()
+        old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, status, headers, body, size, etag, last_modified, stored_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, status, json.dumps(headers), data, len(data), headers.get('etag'),
+             headers.get('last-modified'), now, now)
+        )
+        self.total_bytes += len(data) - (old[0] if old else 0)
+        self._evict()
+        self._conn.commit()
+
+    def touch(self, key):
+        """304之后重新计算有效期"""
+        now = time.time()
+        self._conn.execute("UPDATE responses SET stored_at = ?, last_access = ? WHERE key = ?", (now, now, key))
+        self._conn.commit()
+
+    def mark_used(self, key):
+        self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.stats['evicted'] += 1
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def clear(self):
+        self._conn.execute("DELETE FROM responses")
+        self._conn.commit()
+        self.total_bytes = 0
+
+    def report(self):
+        stats = self.stats
+        print(f"  HTTP缓存: 命中 {stats['hits']}, 304重新验证 {stats['revalidated']}, 未命中 {stats['misses']}, "
+              f"淘汰 {stats['evicted']}, 占用 {self.total_bytes / 1024 / 1024:.1f} MB")
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """包在真正的 transport 外面，只缓存GET请求的200响应，其它请求原样转发"""
+    def __init__(self, transport, cache, ttl=None):
+        self._transport = transport
+        self.cache = cache
+        self.ttl = ttl
+
+    async def handle_async_request(self, request):
+        if request.method != 'GET' or 'range' in request.headers:
+            return await self._transport.handle_async_request(request)
+        key = cache_key(request.url)
+        entry = self.cache.get(key, self.ttl)
+        if entry and entry['fresh']:
+            self.cache.stats['hits'] += 1
+            self.cache.mark_used(key)
+            return self._from_entry(entry, request)
+        if entry:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = await self._transport.handle_async_request(request)
+        if response.status_code == 304 and entry:
+            await response.aclose()
+            self.cache.stats['revalidated'] += 1
+            self.cache.touch(key)
+            return self._from_entry(entry, request)
+        if response.status_code != 200 or 'no-store' in response.headers.get('cache-control', ''):
+            return response
+        self.cache.stats['misses'] += 1
+        # transport 层的响应体还没解压，这里读出解压后的内容存进去
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        headers = {k.lower(): v for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS}
+        self.cache.put(key, 200, headers, body)
+        return httpx.Response(200, headers=headers, content=body, request=request, extensions=response.extensions)
+
+    @staticmethod
+    def _from_entry(entry, request):
+        return httpx.Response(entry['status'], headers=entry['headers'], content=entry['body'],
+                              request=request, extensions={'from_cache': True})
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,176 @@
+import contextlib
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import httpx
+
+from http_cache import CachingTransport, cache_key
+
+# 每类host一个独立的客户端：列表API请求小而频繁，媒体下载大而慢，
+# 分开之后大文件传输不会占满连接，让列表请求排队。
+# cache_ttl: 传入 HttpCache 时这类请求走缓存，值是缓存有效期（秒），None 表示用缓存自己的默认值
+DEFAULT_CLIENT_CONFIG = {
+    'api': {'max_connections': 4, 'max_keepalive_connections': 4, 'timeout': 30.0, 'cache': True, 'cache_ttl': None},
+    'media': {'max_connections': 16, 'max_keepalive_connections': 16, 'timeout': None},
+    'saucenao': {'max_connections': 2, 'max_keepalive_connections': 2, 'timeout': 30.0},
+}
+
+# 空闲连接保留多久（秒），保持得久一点，走代理时能少做很多次TLS握手
+KEEPALIVE_EXPIRY = 60.0
+
+def host_class(url):
+    """按URL判断属于哪类host：saucenao / api(*.json) / media"""
+    parts = urlsplit(str(url))
+    if 'saucenao' in (parts.hostname or ''):
+        return 'saucenao'
+    if parts.path.endswith('.json'):
+        return 'api'
+    return 'media'
+
+def http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class ClientPool:
+    """
+    按host类别管理 httpx.AsyncClient，每类有自己的连接数、超时和是否启用HTTP/2。
+    提供和 AsyncClient 一样的 get/post/stream，按URL自动选客户端，调用方不需要关心。
+    通过 httpcore 的 trace 统计新建连接/TLS握手次数，看 keep-alive 复用得怎么样。
+    传入 cache (http_cache.HttpCache) 时，配置了 cache 的类别(默认只有api)的GET请求走磁盘缓存，关闭时一并关闭缓存。
+    传入 metrics (download_metrics.DownloadMetrics) 时按类别和状态码记录响应数、新建连接数。
+    """
+    def __init__(self, proxies=None, timeout=None, config=None, http2=False, follow_redirects=True, cache=None,
+                 metrics=None):
+        self.proxies = proxies
+        self.timeout = timeout
+        self.config = {name: dict(options) for name, options in DEFAULT_CLIENT_CONFIG.items()}
+        for name, options in (config or {}).items():
+            self.config.setdefault(name, {}).update(options)
+        if http2 and not http2_available():
+            print("未安装 h2，HTTP/2 不可用，使用 HTTP/1.1 (pip install httpx[http2])")
+            http2 = False
+        self.http2 = http2
+        self.follow_redirects = follow_redirects
+        self.cache = cache
+        self.metrics = metrics
+        self._clients = {}
+        self.stats = defaultdict(lambda: {'requests': 0, 'connections': 0, 'tls_handshakes': 0})
+
+    def client(self, name):
+        if name not in self._clients:
+            options = self.config.get(name) or self.config['media']
+            timeout = options.get('timeout') or self.timeout or 30.0
+
+            async def on_request(request, name=name):
+                self.stats[name]['requests'] += 1
+                request.extensions['trace'] = self._tracer(name)
+
+            async def on_response(response, name=name):
+                if self.metrics is not None:
+                    source = 'cache' if response.extensions.get('from_cache') else 'network'
+                    self.metrics.inc('http_responses_total', host_class=name, status=response.status_code, source=source)
+
+            limits = httpx.Limits(
+                max_connections=options.get('max_connections'),
+                max_keepalive_connections=options.get('max_keepalive_connections'),
+                keepalive_expiry=options.get('keepalive_expiry', KEEPALIVE_EXPIRY),
+            )
+            http2 = options.get('http2', self.http2)
+            if self._cached(name):
+                # 缓存包在 transport 外面，走代理时每个代理的 transport 也要包一层
+                ttl = options.get('cache_ttl')
+                proxies = self.proxies
+                if isinstance(proxies, str):
+                    proxies = {'all://': proxies}
+                mounts = {
+                    pattern: CachingTransport(httpx.AsyncHTTPTransport(proxy=proxy, limits=limits, http2=http2), self.cache, ttl)
+                    for pattern, proxy in (proxies or {}).items()
+                }
+                self._clients[name] = httpx.AsyncClient(
+                    timeout=httpx.Timeout(timeout),
+                    transport=CachingTransport(httpx.AsyncHTTPTransport(limits=limits, http2=http2), self.cache, ttl),
+                    mounts=mounts,
+                    follow_redirects=self.follow_redirects,
+                    event_hooks={'request': [on_request], 'response': [on_response]},
+                )
+            else:
+                self._clients[name] = httpx.AsyncClient(
+                    timeout=httpx.Timeout(timeout),
+                    proxies=self.proxies,
+                    limits=limits,
+                    http2=http2,
+                    follow_redirects=self.follow_redirects,
+                    event_hooks={'request': [on_request], 'response': [on_response]},
+                )
+        return self._clients[name]
+
+    def _cached(self, name):
+        return self.cache is not None and (self.config.get(name) or {}).get('cache', False)
+
+    def is_cached(self, url):
+        """这个URL在缓存里且没过期，请求不会走网络（调用方可以不占限速名额）"""
+        name = host_class(url)
+        return self._cached(name) and self.cache.is_fresh(cache_key(url), self.config[name].get('cache_ttl'))
+
+    def _tracer(self, name):
+        stats = self.stats[name]
+
+        async def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.complete':
+                stats['connections'] += 1
+                if self.metrics is not None:
+                    self.metrics.inc('http_connections_opened_total', host_class=name)
+            elif event_name == 'connection.start_tls.complete':
+                stats['tls_handshakes'] += 1
+        return trace
+
+    def for_url(self, url):
+        return self.client(host_class(url))
+
+    async def get(self, url, **kwargs):
+        return await self.for_url(url).get(url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.for_url(url).post(url, **kwargs)
+
+    def stream(self, method, url, **kwargs):
+        return self.for_url(url).stream(method, url, **kwargs)
+
+    async def aclose(self):
+        for client in self._clients.values():
+            with contextlib.suppress(Exception):
+                await client.aclose()
+        self._clients.clear()
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    def report(self):
+        if not self.stats:
+            return
+        print("\n连接复用 (新建连接越少越好，请求数包括缓存命中):")
+        for name, stats in self.stats.items():
+            requests = stats['requests']
+            reused = 1 - stats['connections'] / requests if requests else 0
+            print(f"  {name}: 请求 {requests}, 新建连接 {stats['connections']}, "
+                  f"TLS握手 {stats['tls_handshakes']}, 复用率 {reused:.0%}")
+        if self.cache is not None:
+            self.cache.report()
+
+@contextlib.asynccontextmanager
+async def shared_or_new(clients=None, **kwargs):
+    """传入了共享的 ClientPool 就直接用；没有就临时建一个，用完关闭"""
+    if clients is not None:
+        yield clients
+        return
+    async with ClientPool(**kwargs) as pool:
+        yield pool
@@ -0,0 +1,401 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import combinations
+from math import comb
+
+import imagehash
+import numpy as np
+from PIL import Image
+
+# hash_to_delete.py 和 webui 的查重共用的部分：并行计算感知哈希、近邻查找和分组
+
+# 图片数少于这个值时直接在当前进程算，不值得启动进程池
+MIN_PARALLEL_IMAGES = 64
+
+# 放在被扫描的文件夹里的哈希缓存，按相对路径记录，文件夹整个移动后缓存仍然有效
+PHASH_CACHE_FILENAME = ".phash_cache.sqlite"
+
+# phash 最后把图片缩到 (hash_size*4)² 再做DCT，缩小解码时短边至少保留这个尺寸的这么多倍
+REDUCED_SCALE = 8
+
+def hash_kind(hash_size=8, reduced=True):
+    """缓存里记录的哈希算法和大小，变了以后旧的缓存不再使用"""
+    return f"phash{hash_size}" + ("r" if reduced else "")
+
+def load_for_hash(img, min_side):
+    """
+    按算哈希需要的尺寸解码：JPEG 用 draft() 让解码器直接按 1/2~1/8 缩小并且只解灰度，
+    其它格式解码后先按整数倍 reduce()（求块平均，比直接 LANCZOS 缩小快得多）。
+    返回短边不小于 min_side 的灰度图。
+    """
+    if img.format == 'JPEG':
+        img.draft('L', (min_side, min_side))
+    img = img.convert('L')
+    factor = min(img.size) // min_side
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+def image_phash(image_path, hash_size=8, reduced=True):
+    """
+    返回 (哈希, 宽, 高, 错误信息)，在进程池里运行；hash_size=8 是64位哈希，16 是256位。
+    reduced=True 时按缩小的尺寸解码(load_for_hash)，宽高仍是原图的。
+    """
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+            if reduced:
+                img = load_for_hash(img, hash_size * 4 * REDUCED_SCALE)
+            return imagehash.phash(img, hash_size=hash_size), width, height, None
+    except Exception as e:
+        return None, 0, 0, str(e)
+
+class PhashCache:
+    """
+    文件夹里的感知哈希缓存（SQLite）：每个文件按 (相对路径, 大小, mtime_ns) 记录哈希和宽高，
+    文件大小或修改时间变了就重新计算，重新扫描时只算新增和改过的图片。
+    """
+    def __init__(self, directory, hash_size=8, reduced=True):
+        self.directory = os.path.abspath(directory)
+        self.kind = hash_kind(hash_size, reduced)
+        self.path = os.path.join(self.directory, PHASH_CACHE_FILENAME)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                relpath TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                kind TEXT,
+                hash TEXT,
+                width INTEGER,
+                height INTEGER
+            )
+        """)
+        self._conn.commit()
+        self._rows = {
+            row[0]: row[1:] for row in self._conn.execute(
+                "SELECT relpath, size, mtime_ns, kind, hash, width, height FROM hashes"
+            )
+        }
+        self._pending = []
+        self.hits = self.misses = 0
+
+    def _relpath(self, path):
+        return os.path.relpath(os.path.abspath(path), self.directory).replace(os.sep, '/')
+
+    def lookup(self, path, stat=None):
+        """没变过的文件返回 ImageHash，否则返回None"""
+        stat = stat or os.stat(path)
+        row = self._rows.get(self._relpath(path))
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns and row[2] == self.kind:
+            self.hits += 1
+            return imagehash.hex_to_hash(row[3])
+        self.misses += 1
+        return None
+
+    def resolution(self, path):
+        """缓存里的 (宽, 高)，没有时返回None"""
+        row = self._rows.get(self._relpath(path))
+        return (row[4], row[5]) if row else None
+
+    def store(self, path, stat, image_hash, width, height):
+        row = (stat.st_size, stat.st_mtime_ns, self.kind, str(image_hash), width, height)
+        relpath = self._relpath(path)
+        self._rows[relpath] = row
+        self._pending.append((relpath,) + row)
+        if len(self._pending) >= 500:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO hashes (relpath, size, mtime_ns, kind, hash, width, height) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", self._pending
+            )
+            self._conn.commit()
+            self._pending = []
+
+    def prune(self, paths):
+        """删掉不在 paths 里的记录（文件已删除或改名），返回删除的数量"""
+        keep = {self._relpath(path) for path in paths}
+        stale = [relpath for relpath in self._rows if relpath not in keep]
+        if stale:
+            self._conn.executemany("DELETE FROM hashes WHERE relpath = ?", [(relpath,) for relpath in stale])
+            self._conn.commit()
+            for relpath in stale:
+                del self._rows[relpath]
+        return len(stale)
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+def hash_images(paths, workers=None, chunksize=None, progress=None, on_error=None, cache=None, hash_size=8,
+                reduced=True, resolutions=None):
+    """
+    用进程池并行计算感知哈希，按 paths 的顺序逐个产出 (路径, 哈希)，算不出来的跳过。
+    - workers: 进程数，None 按CPU核数
+    - chunksize: 每次发给一个进程的图片数，None 时按图片数和进程数自动选，减少进程间通信
+    - progress(已完成数, 总数): 进度回调
+    - on_error(路径, 错误信息): 图片打不开时的回调
+    - cache: PhashCache，没变过的文件直接用缓存，新算的写回缓存（缓存的 hash_size 要一样）
+    - hash_size: 8 为64位哈希，16 为256位
+    - reduced: 按缩小的尺寸解码，快几倍，哈希和完整解码相差很小（见 benchmarks/bench_phash_decode.py）
+    - resolutions: 传入字典时顺便填上 {路径: 宽*高}（缓存命中的用缓存里的宽高），挑保留哪张时不用再打开图片
+    """
+    paths = list(paths)
+    total = len(paths)
+    cached = {}
+    stats = {}
+    if cache is not None:
+        for path in paths:
+            try:
+                stats[path] = os.stat(path)
+            except OSError:
+                continue
+            image_hash = cache.lookup(path, stats[path])
+            if image_hash is not None:
+                cached[path] = image_hash
+                if resolutions is not None:
+                    width, height = cache.resolution(path)
+                    resolutions[path] = width * height
+    todo = [path for path in paths if path not in cached]
+    hash_one = partial(image_phash, hash_size=hash_size, reduced=reduced)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(todo) < MIN_PARALLEL_IMAGES:
+        results = map(hash_one, todo)
+        pool = None
+    else:
+        if chunksize is None:
+            # 每个进程大约分到 16 块，既能摊薄通信开销，最后也不会有进程空等太久
+            chunksize = max(1, min(256, len(todo) // (workers * 16)))
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(hash_one, todo, chunksize=chunksize)
+    try:
+        for done, path in enumerate(paths, 1):
+            if path in cached:
+                yield path, cached[path]
+            else:
+                image_hash, width, height, error = next(results)
+                if image_hash is not None:
+                    if cache is not None and path in stats:
+                        cache.store(path, stats[path], image_hash, width, height)
+                    if resolutions is not None:
+                        resolutions[path] = width * height
+                    yield path, image_hash
+                elif on_error is not None:
+                    on_error(path, error)
+            if progress is not None:
+                progress(done, total)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if cache is not None:
+            cache.flush()
+
+def hash_to_int(image_hash):
+    """ImageHash 转成整数，两个整数异或后数1的个数就是 hash1 - hash2"""
+    if isinstance(image_hash, int):
+        return image_hash
+    return int(str(image_hash), 16)
+
+def hash_bits(image_hashes, values):
+    """ImageHash 的位数；直接给整数时按最大的值取 64 的倍数"""
+    first = next(iter(image_hashes))
+    if hasattr(first, 'hash'):
+        return first.hash.size
+    return max(64, (max(value.bit_length() for value in values) + 63) // 64 * 64)
+
+def _index_cost(bits, radius, n):
+    """
+    多索引哈希(multi-index hashing)的分段数：把哈希切成 m 段，距离 <= radius 的两个哈希
+    至少有一段的距离 <= radius // m。按 (每次查询要探测的桶数 + 预计候选数) 最小来选 m，
+    返回 (每次查询的代价, m)。
+    """
+    best = None
+    for m in range(1, min(radius + 1, bits) + 1):
+        width = bits // m
+        sub_radius = radius // m
+        probes = m * sum(comb(width, k) for k in range(sub_radius + 1))
+        candidates = probes * n / 2 ** width
+        cost = probes + candidates
+        if best is None or cost < best[0]:
+            best = (cost, m)
+    return best
+
+def _choose_chunks(bits, radius, n):
+    return _index_cost(bits, radius, n)[1]
+
+class HammingIndex:
+    """
+    汉明距离半径查询的索引（多索引哈希）：哈希切成几段，每段一个 {段值: [编号]} 的表，
+    查询时在每段里枚举距离 <= radius // 段数 的值，候选再按完整距离过滤。
+    随机分布的哈希每次查询只看几十个候选，n 个哈希分组接近线性。
+    """
+    def __init__(self, values, bits=64, radius=5, chunks=None):
+        self.values = list(values)
+        self.bits = bits
+        self.radius = radius
+        self.chunks = chunks or _choose_chunks(bits, radius, max(len(self.values), 2))
+        self.sub_radius = radius // self.chunks
+        # 前面几段多分1位，保证覆盖全部位
+        widths = [bits // self.chunks + (1 if i < bits % self.chunks else 0) for i in range(self.chunks)]
+        self.spans = []
+        shift = 0
+        for width in widths:
+            self.spans.append((shift, width))
+            shift += width
+        self.tables = [{} for _ in self.spans]
+        for index, value in enumerate(self.values):
+            for table, (shift, width) in zip(self.tables, self.spans):
+                table.setdefault((value >> shift) & ((1 << width) - 1), []).append(index)
+        self._flips = {width: self._flip_masks(width) for _, width in self.spans}
+
+    def _flip_masks(self, width):
+        masks = [0]
+        for k in range(1, self.sub_radius + 1):
+            for bits in combinations(range(width), k):
+                mask = 0
+                for bit in bits:
+                    mask |= 1 << bit
+                masks.append(mask)
+        return masks
+
+    def query(self, value):
+        """返回距离 value 不超过 radius 的所有编号（无序）"""
+        seen = set()
+        found = []
+        values = self.values
+        radius = self.radius
+        for table, (shift, width) in zip(self.tables, self.spans):
+            key = (value >> shift) & ((1 << width) - 1)
+            for mask in self._flips[width]:
+                bucket = table.get(key ^ mask)
+                if not bucket:
+                    continue
+                for index in bucket:
+                    if index in seen:
+                        continue
+                    seen.add(index)
+                    if (values[index] ^ value).bit_count() <= radius:
+                        found.append(index)
+        return found
+
+# 异或后每个字节里1的个数，NumPy 没有 bitwise_count (2.0 之前) 时用
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# 索引每个探测/候选的用时大约是 NumPy 比较一对64位哈希的这么多倍（实测），用来在两种方式里自动选
+NUMPY_PAIR_RATIO = 68
+
+def pack_hashes(values, bits=64):
+    """整数哈希打包成 (n, bits/64) 的 uint64 数组，256位哈希每个占4个字"""
+    nbytes = (bits + 63) // 64 * 8
+    buffer = b''.join(value.to_bytes(nbytes, 'little') for value in values)
+    return np.frombuffer(buffer, dtype='<u8').reshape(len(values), nbytes // 8)
+
+def _popcount(x):
+    """每个 uint64 里1的个数"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+def _block_distances(a, b):
+    """a、b 两块哈希之间的距离矩阵，逐个字异或再累加，不生成三维的中间数组"""
+    distances = _popcount(a[:, 0, None] ^ b[None, :, 0])
+    if a.shape[1] > 1:
+        distances = distances.astype(np.uint16)
+        for word in range(1, a.shape[1]):
+            distances += _popcount(a[:, word, None] ^ b[None, :, word])
+    return distances
+
+def hamming_edges(packed, threshold=5, block=None):
+    """
+    分块计算两两汉明距离(异或 + popcount)，返回距离 <= threshold 的所有 (i, j) 对，i < j。
+    每块的中间结果控制在几MB，能放进CPU缓存。
+    """
+    n, words = packed.shape
+    if block is None:
+        block = 1024
+    lefts, rights = [], []
+    for start in range(0, n, block):
+        a = packed[start:start + block]
+        for other in range(start, n, block):
+            b = packed[other:other + block]
+            distances = _block_distances(a, b)
+            close = distances <= threshold
+            if other == start:
+                # 对角块只要上三角，不要自己和自己
+                close = np.triu(close, k=1)
+            i, j = np.nonzero(close)
+            if len(i):
+                lefts.append(i + start)
+                rights.append(j + other)
+    if not lefts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(lefts), np.concatenate(rights)
+
+def _edge_neighbors(values, bits, threshold):
+    """用 NumPy 算出边表，返回 编号 -> 相邻编号 的查询函数"""
+    left, right = hamming_edges(pack_hashes(values, bits), threshold)
+    # 两个方向都要，转成按起点排序的邻接表(CSR)
+    sources = np.concatenate([left, right])
+    targets = np.concatenate([right, left])
+    order = np.argsort(sources, kind='stable')
+    sources, targets = sources[order], targets[order]
+    offsets = np.searchsorted(sources, np.arange(len(values) + 1))
+    return lambda k: targets[offsets[k]:offsets[k + 1]].tolist()
+
+def group_similar_hashes(image_hashes, threshold=5, engine='auto'):
+    """
+    image_hashes: {路径: 哈希}，按字典顺序贪心分组，结果和两两比较的写法完全一样：
+    依次取还没分组的图片作为组首，把和组首距离 <= threshold 且还没分组的图片都放进这一组。
+    只返回多于一张图片的组。
+    engine: 'numpy' 分块两两比较，'index' 多索引哈希，'auto' 按哈希数量选
+    """
+    paths = list(image_hashes)
+    if not paths:
+        return []
+    # 完全相同的哈希只算一次
+    members = {}
+    for index, path in enumerate(paths):
+        members.setdefault(hash_to_int(image_hashes[path]), []).append(index)
+    values = list(members)
+    bits = hash_bits(image_hashes.values(), values)
+    position = {value: k for k, value in enumerate(values)}
+    if engine == 'auto':
+        # 两两比较 n²/2 对，索引查询 n 次；哈希少或阈值大(索引候选多)时 NumPy 更快
+        words = (bits + 63) // 64
+        cost = _index_cost(bits, threshold, len(values))[0]
+        engine = 'numpy' if len(values) / 2 * words < NUMPY_PAIR_RATIO * cost else 'index'
+    if engine == 'numpy':
+        adjacent = _edge_neighbors(values, bits, threshold)
+        neighbors_of = lambda k: adjacent(k) + [k]
+    elif engine == 'index':
+        index = HammingIndex(values, bits=bits, radius=threshold)
+        neighbors_of = lambda k: index.query(values[k])
+    else:
+        raise ValueError(f"未知的比较方式: {engine}")
+
+    groups = []
+    processed = bytearray(len(paths))
+    for i, path in enumerate(paths):
+        if processed[i]:
+            continue
+        processed[i] = 1
+        k = position[hash_to_int(image_hashes[path])]
+        neighbors = sorted(j for m in neighbors_of(k) for j in members[values[m]] if not processed[j])
+        if not neighbors:
+            continue
+        for j in neighbors:
+            processed[j] = 1
+        groups.append([path] + [paths[j] for j in neighbors])
+    return groups
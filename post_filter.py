@@ -0,0 +1,122 @@
+import os
+from collections import Counter
+from pathlib import Path
+
+# 视频/动图对应的扩展名，不下载视频或GIF时直接按扩展名过滤
+VIDEO_EXTS = {'mp4', 'webm', 'zip', 'swf'}
+GIF_EXTS = {'gif'}
+
+# 规则名 -> 说明，同时决定检查顺序（便宜的先查）
+RULES = {
+    'md5_blacklist': 'md5 在黑名单中',
+    'file_ext': '文件类型不在允许列表',
+    'exclude_ext': '文件类型在排除列表(含不下载的视频/GIF)',
+    'rating': '分级不在允许列表',
+    'min_score': '分数过低',
+    'max_score': '分数过高',
+    'min_width': '宽度过小',
+    'min_height': '高度过小',
+    'max_width': '宽度过大',
+    'max_height': '高度过大',
+    'min_file_size': '文件过小',
+    'max_file_size': '文件过大',
+    'include_tags': '缺少必须包含的标签',
+    'exclude_tags': '包含排除的标签',
+}
+
+def _as_set(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split()
+    return {str(v).lower().lstrip('.') for v in value}
+
+def load_md5_list(source):
+    """黑名单可以是 md5 列表，也可以是每行一个 md5 的文本文件路径"""
+    if source is None:
+        return set()
+    if isinstance(source, (str, Path)) and os.path.isfile(source):
+        with open(source, 'r', encoding='utf-8') as f:
+            return {line.strip().lower() for line in f if line.strip() and not line.startswith('#')}
+    return {str(md5).lower() for md5 in source}
+
+class PostFilter:
+    """
+    在下载前根据 posts.json 里的元数据过滤帖子，不满足条件的帖子不会发起任何媒体请求。
+    rules 是一个字典，可用的键见 RULES，例如:
+        {'rating': ['g', 's'], 'min_score': 10, 'min_width': 1024,
+         'exclude_tags': ['comic', 'monochrome'], 'md5_blacklist': 'blacklist.txt'}
+    每条规则刷掉的数量记录在 dropped 中，可用 report() 打印。
+    """
+    def __init__(self, rules=None, download_videos=True, download_gifs=True):
+        rules = dict(rules or {})
+        unknown = set(rules) - set(RULES)
+        if unknown:
+            raise ValueError(f"未知的过滤规则: {', '.join(sorted(unknown))}")
+        self.rules = rules
+        self.allowed_ext = _as_set(rules.get('file_ext'))
+        self.excluded_ext = _as_set(rules.get('exclude_ext')) or set()
+        if not download_videos:
+            self.excluded_ext |= VIDEO_EXTS
+        if not download_gifs:
+            self.excluded_ext |= GIF_EXTS
+        self.ratings = _as_set(rules.get('rating'))
+        self.include_tags = _as_set(rules.get('include_tags'))
+        self.exclude_tags = _as_set(rules.get('exclude_tags'))
+        self.md5_blacklist = load_md5_list(rules.get('md5_blacklist'))
+        self.checked = 0
+        self.dropped = Counter()
+
+    def reject_reason(self, item):
+        """返回刷掉该帖子的规则名，通过时返回None"""
+        rules = self.rules
+        md5 = (item.get('md5') or '').lower()
+        if md5 and md5 in self.md5_blacklist:
+            return 'md5_blacklist'
+
+        ext = (item.get('file_ext') or os.path.splitext(item.get('file_url') or '')[1]).lower().lstrip('.')
+        if ext and ext in self.excluded_ext:
+            return 'exclude_ext'
+        if ext and self.allowed_ext is not None and ext not in self.allowed_ext:
+            return 'file_ext'
+
+        if self.ratings is not None and (item.get('rating') or '').lower() not in self.ratings:
+            return 'rating'
+
+        score = item.get('score')
+        if score is not None:
+            if rules.get('min_score') is not None and score < rules['min_score']:
+                return 'min_score'
+            if rules.get('max_score') is not None and score > rules['max_score']:
+                return 'max_score'
+
+        for rule, field, is_min in (('min_width', 'image_width', True), ('min_height', 'image_height', True),
+                                    ('max_width', 'image_width', False), ('max_height', 'image_height', False),
+                                    ('min_file_size', 'file_size', True), ('max_file_size', 'file_size', False)):
+            limit, value = rules.get(rule), item.get(field)
+            if limit is None or value is None:
+                continue
+            if (is_min and value < limit) or (not is_min and value > limit):
+                return rule
+
+        if self.include_tags or self.exclude_tags:
+            tags = set(item.get('tag_string', '').lower().split())
+            if self.include_tags and not self.include_tags <= tags:
+                return 'include_tags'
+            if self.exclude_tags and self.exclude_tags & tags:
+                return 'exclude_tags'
+        return None
+
+    def accept(self, item):
+        self.checked += 1
+        reason = self.reject_reason(item)
+        if reason is None:
+            return True
+        self.dropped[reason] += 1
+        return False
+
+    def report(self):
+        total = sum(self.dropped.values())
+        print(f"\n下载前过滤: 检查 {self.checked} 个帖子, 过滤掉 {total} 个")
+        for rule, count in self.dropped.most_common():
+            print(f"  {rule} ({RULES.get(rule, rule)}): {count}")
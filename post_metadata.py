@@ -0,0 +1,102 @@
+import gzip
+import json
+import sqlite3
+import zlib
+from pathlib import Path
+
+from download_manifest import MANIFEST_FILENAME
+
+METADATA_FILENAME = "post_metadata.jsonl.gz"
+
+class PostMetadataStore:
+    """
+    保存目录下的帖子元数据（完整的 posts.json 条目），gzip 压缩的 JSONL，每行一个帖子，按 md5 去重。
+    每写一条都做一次 sync flush，中途崩溃也只会丢掉最后没写完的一条。
+    之后改标签规则时用 recaption.py 从这里重新生成TXT，不需要联网。
+    已保存的md5记在下载清单(SQLite)的 metadata_posts 表里，打开时不用解压整个文件。
+    """
+    def __init__(self, base_save_dir):
+        self.path = Path(base_save_dir) / METADATA_FILENAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path.parent / MANIFEST_FILENAME)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS metadata_posts (md5 TEXT PRIMARY KEY)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        self._file = None
+        self._build_index()
+
+    def _build_index(self):
+        """第一次打开(或元数据文件被删掉)时按文件内容重建md5索引"""
+        indexed = self._conn.execute("SELECT value FROM meta WHERE key = 'metadata_indexed'").fetchone()
+        if indexed and self.path.exists():
+            return
+        self._conn.execute("DELETE FROM metadata_posts")
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO metadata_posts (md5) VALUES (?)",
+            ((item['md5'],) for item in self._read() if item.get('md5'))
+        )
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('metadata_indexed', '1')")
+        self._conn.commit()
+
+    def _read(self):
+        if not self.path.exists():
+            return
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # 崩溃时写了一半的行
+                        continue
+            except (EOFError, zlib.error, gzip.BadGzipFile):
+                # 最后一段没有正常结束，前面的内容仍然有效
+                return
+
+    def __contains__(self, md5):
+        return self._conn.execute("SELECT 1 FROM metadata_posts WHERE md5 = ?", (md5,)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM metadata_posts").fetchone()[0]
+
+    def add(self, item):
+        md5 = item.get('md5')
+        if not md5 or md5 in self:
+            return False
+        if self._file is None:
+            # 追加一个新的gzip段，读的时候会自动接起来
+            self._file = gzip.open(self.path, 'at', encoding='utf-8')
+        self._file.write(json.dumps(item, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._file.flush()
+        # 先写文件再记索引，两步之间崩溃最多是下次再写一遍同一个帖子，items() 会去重
+        self._conn.execute("INSERT OR IGNORE INTO metadata_posts (md5) VALUES (?)", (md5,))
+        self._conn.commit()
+        return True
+
+    def items(self):
+        """按md5去重后的所有帖子"""
+        latest = {}
+        for item in self._read():
+            md5 = item.get('md5')
+            if md5:
+                latest[md5] = item
+        return latest
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,129 @@
+import asyncio
+import contextlib
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+# 每个host每秒最多发起的请求数，None 表示不限速（只受并发窗口限制）
+DEFAULT_HOST_RATES = {
+    'kagamihara.donmai.us': 8.0,
+    'danbooru.donmai.us': 8.0,
+}
+
+# 被限流时会返回的状态码
+THROTTLE_STATUS = {429, 503}
+# 值得重试的状态码（其余4xx重试也没用）
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+def parse_retry_after(value):
+    """解析 Retry-After 头，支持秒数和HTTP日期两种格式，返回秒数或None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+def backoff_delay(attempt, retry_after=None, base=1.0, cap=60.0):
+    """指数退避 + 全抖动；服务器给了 Retry-After 时不会早于它"""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 个请求，允许突发 burst 个"""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class _HostState:
+    def __init__(self, max_per_host, rate):
+        self.max_limit = max_per_host
+        # AIMD 并发窗口，从一半开始慢慢涨
+        self.limit = max(1.0, max_per_host / 2)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.bucket = TokenBucket(rate) if rate else None
+        self.condition = asyncio.Condition()
+        self.throttled = 0
+
+class AdaptiveHostLimiter:
+    """
+    全局在途请求上限 + 每个host的自适应并发窗口(AIMD) + 每个host的令牌桶限速。
+    被 429/503 限流时窗口减半并按 Retry-After 冷却，响应正常时窗口每轮 +1。
+    """
+    def __init__(self, max_in_flight=16, max_per_host=8, host_rates=None):
+        self.max_in_flight = max_in_flight
+        self.max_per_host = max_per_host
+        self.host_rates = dict(DEFAULT_HOST_RATES if host_rates is None else host_rates)
+        self._global = asyncio.Semaphore(max_in_flight)
+        self._hosts = {}
+
+    def _state(self, url):
+        host = urlsplit(url).hostname or ''
+        if host not in self._hosts:
+            self._hosts[host] = _HostState(self.max_per_host, self.host_rates.get(host))
+        return self._hosts[host]
+
+    def in_flight(self):
+        """每个host当前在途的请求数"""
+        return {host: state.in_flight for host, state in self._hosts.items()}
+
+    def limits(self):
+        """每个host当前的并发窗口"""
+        return {host: int(state.limit) for host, state in self._hosts.items()}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url):
+        state = self._state(url)
+        # 先拿host名额再拿全局名额，避免排队等某个host时占着全局名额
+        async with state.condition:
+            await state.condition.wait_for(lambda: state.in_flight < int(state.limit))
+            state.in_flight += 1
+        try:
+            wait = state.cooldown_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if state.bucket:
+                await state.bucket.acquire()
+            async with self._global:
+                yield
+        finally:
+            async with state.condition:
+                state.in_flight -= 1
+                state.condition.notify_all()
+
+    def feedback(self, url, status_code, headers=None):
+        """根据响应调整该host的并发窗口，返回建议的等待秒数(Retry-After)或None"""
+        state = self._state(url)
+        if status_code in THROTTLE_STATUS:
+            retry_after = parse_retry_after((headers or {}).get('Retry-After'))
+            state.limit = max(1.0, state.limit / 2)
+            state.throttled += 1
+            cooldown = retry_after if retry_after is not None else 1.0
+            state.cooldown_until = max(state.cooldown_until, time.monotonic() + cooldown)
+            print(f"被限流 ({status_code}): {urlsplit(url).hostname} 并发降到 {int(state.limit)}, 冷却 {cooldown:.1f} 秒")
+            return retry_after
+        if status_code < 500:
+            state.limit = min(state.max_limit, state.limit + 1 / state.limit)
+        return None
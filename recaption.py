@@ -0,0 +1,78 @@
+import time
+from pathlib import Path
+
+from captions import make_caption
+from download_manifest import DownloadManifest
+from downloader_engine import line_to_folder_name
+from post_filter import VIDEO_EXTS, GIF_EXTS
+from post_metadata import PostMetadataStore
+
+def write_if_changed(path, text):
+    """内容没变时不写，返回是否写入"""
+    try:
+        if path.read_text(encoding='utf-8') == text:
+            return False
+    except FileNotFoundError:
+        pass
+    path.write_text(text, encoding='utf-8')
+    return True
+
+def recaption(save_dir, caption_rules=None, update_folders=True, dry_run=False):
+    """
+    用下载时保存的帖子元数据 (post_metadata.jsonl.gz) 按新的规则重新生成所有TXT标签，不联网。
+    仓库(.store)里的TXT和各标签文件夹里的TXT副本都会更新；update_folders=False 时只更新仓库。
+    返回 (帖子数, 写入的TXT数)。
+    """
+    base_save_dir = Path(save_dir)
+    caption = make_caption(caption_rules)
+    started = time.perf_counter()
+    with PostMetadataStore(base_save_dir) as metadata:
+        items = metadata.items()
+    print(f"读取元数据: {len(items)} 个帖子")
+
+    written = missing = 0
+    with DownloadManifest(base_save_dir) as manifest:
+        for md5, item in items.items():
+            # 视频和GIF只保存了第一帧，下载时就不写TXT
+            if (item.get('file_ext') or '').lower() in VIDEO_EXTS | GIF_EXTS:
+                continue
+            entry = manifest.get(md5)
+            if entry is None or not entry['path'].exists():
+                missing += 1
+                continue
+            text = caption(item)
+            targets = [entry['path'].with_suffix('.txt')]
+            if update_folders:
+                targets += [
+                    base_save_dir / line_to_folder_name(line) / targets[0].name
+                    for line in manifest.claims(md5)
+                ]
+            for txt_path in targets:
+                if not txt_path.parent.exists():
+                    continue
+                if dry_run:
+                    if not txt_path.exists() or txt_path.read_text(encoding='utf-8') != text:
+                        written += 1
+                    continue
+                if write_if_changed(txt_path, text):
+                    written += 1
+
+    action = '需要更新' if dry_run else '已更新'
+    print(f"{action} {written} 个TXT, 清单中找不到文件的帖子 {missing} 个, 用时 {time.perf_counter() - started:.2f} 秒")
+    return len(items), written
+
+if __name__ == "__main__":
+    save_dir = "downloaded_images1"  # 下载器的保存目录
+    # 新的标签规则，可用的键见 captions.CAPTION_RULES；None 为下载器默认写法
+    caption_rules = {
+        'categories': ['character', 'copyright', 'artist', 'general'],
+        'keep_symbols': True,
+        'rating': True,
+        'artist_prefix': 'by ',
+        'exclude_tags': [],
+        'prepend': [],
+    }
+    update_folders = True  # 同时更新各标签文件夹里的TXT副本
+    dry_run = False  # True 时只统计会改动多少个TXT，不写入
+
+    recaption(save_dir, caption_rules, update_folders=update_folders, dry_run=dry_run)
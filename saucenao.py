@@ -7,6 +7,21 @@ from bs4 import BeautifulSoup
 from pathlib import Path
 from typing import Optional, Dict, List
 
+from http_clients import ClientPool, shared_or_new
+from http_cache import HttpCache, HTTP_CACHE_FILENAME
+
+# 默认配置，直接运行本脚本时在下面 __main__ 里覆盖；webui 等其它地方导入调用时用这里的值
+MIN_REQUEST_INTERVAL = 3
+MAX_REQUEST_INTERVAL = 5
+SAUCE_MINSIM = "80!"
+SAUCE_TIMEOUT = 30.0
+SAUCE_RETRY_MAX_ATTEMPTS = 3
+SAUCE_RETRY_DELAY = 30
+DANBOORU_TIMEOUT = 30.0
+DANBOORU_RETRY_MAX_ATTEMPTS = 3
+DANBOORU_RETRY_DELAY = 10
+HTTP_CACHE_PATH = HTTP_CACHE_FILENAME
+
 # 需要保留下划线的特殊符号集合
 EXCLUDE_SYMBOLS = {"0_0", "(o)_(o)", "+_+", "+_-", "._.", "<o>_<o>", 
                    "<|>_<|>", "=_=", ">_<", "3_3", "6_9", ">_o", "@_@", 
@@ -98,7 +113,8 @@ def get_db_bitmask():
 async def fetch_saucenao(
     image_path: str,
     proxies: Optional[Dict[str, str]] = None,
-    sauce_api_key_list: Optional[List[str]] = None
+    sauce_api_key_list: Optional[List[str]] = None,
+    clients: Optional[ClientPool] = None
 ) -> str:
     api_key = get_random_api_key(sauce_api_key_list) if sauce_api_key_list else None
     use_api = api_key is not None
@@ -120,15 +136,12 @@ async def fetch_saucenao(
             key_display = api_key if api_key else "未使用API"
             print(f"[SauceNAO] 当前模式：{'API调用' if use_api else '网页解析'}，Key：{key_display}")
             
-            async with httpx.AsyncClient(
-                timeout=SAUCE_TIMEOUT,
-                proxies=proxies,
-                follow_redirects=True
-            ) as client:
+            # 批量处理时共用同一个连接池，不用每张图都重新建连接、做TLS握手
+            async with shared_or_new(clients, proxies=proxies) as client:
                 if use_api:
-                    response = await client.post(url=url, params=params, files=files)
+                    response = await client.post(url, params=params, files=files, timeout=SAUCE_TIMEOUT)
                 else:
-                    response = await client.post(url=url, files=files)
+                    response = await client.post(url, files=files, timeout=SAUCE_TIMEOUT)
                 
                 response.raise_for_status()
                 
@@ -215,7 +228,8 @@ async def fetch_saucenao(
 async def get_data_from_danbooru(
     post_url: str,
     proxies: Optional[Dict[str, str]] = None,
-    danbooru_api_key_list: Optional[List[str]] = None
+    danbooru_api_key_list: Optional[List[str]] = None,
+    clients: Optional[ClientPool] = None
 ) -> Dict:
     if "kagamihara.donmai.us/post/show/" not in post_url:
         return {}
@@ -234,12 +248,8 @@ async def get_data_from_danbooru(
             key_display = api_key if api_key else "未使用API"
             print(f"[Danbooru] 当前模式：{'API调用' if use_api else '匿名访问'}，Key：{key_display}")
             
-            async with httpx.AsyncClient(
-                timeout=DANBOORU_TIMEOUT,
-                proxies=proxies,
-                follow_redirects=True
-            ) as client:
-                response = await client.get(api_url, params=params)
+            async with shared_or_new(clients, proxies=proxies) as client:
+                response = await client.get(api_url, params=params, timeout=DANBOORU_TIMEOUT)
                 response.raise_for_status()
                 return response.json()
                 
@@ -273,7 +283,8 @@ async def process_single_image(
     save_file: bool = False,
     is_batch: bool = False,
     sauce_api_key_list: Optional[List[str]] = None,
-    danbooru_api_key_list: Optional[List[str]] = None
+    danbooru_api_key_list: Optional[List[str]] = None,
+    clients: Optional[ClientPool] = None
 ) -> str:
     try:
         if is_batch:
@@ -284,7 +295,8 @@ async def process_single_image(
         danbooru_url = await fetch_saucenao(
             image_path, 
             proxies, 
-            sauce_api_key_list
+            sauce_api_key_list,
+            clients
         )
         print(f"处理图片: {image_path}")
         print(f"Danbooru链接：{danbooru_url}")
@@ -295,7 +307,8 @@ async def process_single_image(
         data = await get_data_from_danbooru(
             danbooru_url, 
             proxies, 
-            danbooru_api_key_list
+            danbooru_api_key_list,
+            clients
         )
         if not data:
             return "未找到有效数据"
@@ -332,7 +345,8 @@ async def process_batch(
     output_format: str,
     proxies: Optional[Dict[str, str]] = None,
     sauce_api_key_list: Optional[List[str]] = None,
-    danbooru_api_key_list: Optional[List[str]] = None
+    danbooru_api_key_list: Optional[List[str]] = None,
+    clients: Optional[ClientPool] = None
 ) -> None:
     folder = Path(folder_path)
     if not folder.is_dir():
@@ -365,7 +379,8 @@ async def process_batch(
             save_file=True,
             is_batch=True,
             sauce_api_key_list=sauce_api_key_list,
-            danbooru_api_key_list=danbooru_api_key_list
+            danbooru_api_key_list=danbooru_api_key_list,
+            clients=clients
         )
         
         if not result.startswith("处理失败") and result not in ["未找到相关数据", "未找到有效数据"]:
@@ -386,29 +401,34 @@ async def main(
 ) -> None:
     target = Path(target_path)
     
-    if batch:
-        await process_batch(
-            target_path, 
-            output_format, 
-            proxies, 
-            sauce_api_key_list, 
-            danbooru_api_key_list
-        )
-    else:
-        if not target.is_file():
-            print(f"错误：{target_path} 不是有效的文件")
-            return
-            
-        result = await process_single_image(
-            str(target), 
-            output_format, 
-            proxies, 
-            save_file=False,
-            sauce_api_key_list=sauce_api_key_list,
-            danbooru_api_key_list=danbooru_api_key_list
-        )
-        print(f"处理结果：")
-        print(result)
+    cache = HttpCache(HTTP_CACHE_PATH) if HTTP_CACHE_PATH else None
+    async with ClientPool(proxies=proxies, cache=cache) as clients:
+        if batch:
+            await process_batch(
+                target_path, 
+                output_format, 
+                proxies, 
+                sauce_api_key_list, 
+                danbooru_api_key_list,
+                clients
+            )
+        else:
+            if not target.is_file():
+                print(f"错误：{target_path} 不是有效的文件")
+                return
+                
+            result = await process_single_image(
+                str(target), 
+                output_format, 
+                proxies, 
+                save_file=False,
+                sauce_api_key_list=sauce_api_key_list,
+                danbooru_api_key_list=danbooru_api_key_list,
+                clients=clients
+            )
+            print(f"处理结果：")
+            print(result)
+        clients.report()
 
 if __name__ == "__main__":
     # 通用配置
@@ -447,6 +467,7 @@ if __name__ == "__main__":
     DANBOORU_TIMEOUT = 30.0  # 超时时间(秒)
     DANBOORU_RETRY_MAX_ATTEMPTS = 3  # 最大重试次数
     DANBOORU_RETRY_DELAY = 10  # 基础重试延迟(秒)
+    HTTP_CACHE_PATH = "http_cache.sqlite"  # Danbooru 帖子JSON的磁盘缓存（和下载器共用），None 表示不缓存
     
     asyncio.run(
         main(
@@ -0,0 +1,156 @@
+import sqlite3
+import time
+from pathlib import Path
+
+# 标签元数据缓存，和 HTTP 缓存一样默认放在当前目录，多个保存目录共用
+TAG_CACHE_FILENAME = "tag_cache.sqlite"
+
+# 标签的帖子数变化很慢，缓存一天
+DEFAULT_TAG_TTL = 24 * 3600
+
+# 超过这个帖子数的行标记为过大（多标签组合在 Danbooru 上翻页很慢）
+DEFAULT_OVERSIZED = 100000
+
+# Danbooru 的元标签前缀，这些不是真正的标签，不查帖子数
+METATAGS = {
+    'rating', 'order', 'score', 'favcount', 'id', 'user', 'approver', 'fav', 'ordfav', 'pool', 'ordpool',
+    'date', 'age', 'width', 'height', 'mpixels', 'ratio', 'filesize', 'filetype', 'duration', 'status',
+    'source', 'md5', 'parent', 'child', 'limit', 'is', 'has', 'tagcount', 'gentags', 'arttags', 'chartags',
+    'copytags', 'metatags', 'commenter', 'noter', 'upvote', 'downvote', 'search', 'random', 'embedded',
+}
+
+def split_line(line):
+    """返回 (必须包含的普通标签, 是否只靠标签数就能确定结果数)"""
+    tags = []
+    exact = True
+    tokens = [token for token in line.strip().split(' ') if token]
+    for token in tokens:
+        prefix = token.split(':', 1)[0].lstrip('-~').lower()
+        if ':' in token and prefix in METATAGS or token[0] in '-~' or '*' in token:
+            exact = False
+            continue
+        tags.append(token.lower())
+    return tags, exact and len(tags) == 1
+
+class TagCache:
+    """
+    标签元数据(帖子数、类别)和整行搜索的帖子数缓存（SQLite）。
+    ttl 内重复预检不发请求。
+    """
+    def __init__(self, path=TAG_CACHE_FILENAME, ttl=DEFAULT_TAG_TTL):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tags (
+                name TEXT PRIMARY KEY,
+                post_count INTEGER,
+                category INTEGER,
+                fetched_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS searches (
+                search TEXT PRIMARY KEY,
+                post_count INTEGER,
+                fetched_at REAL
+            );
+        """)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_tags(self, names):
+        """返回缓存里没过期的 {标签名: 帖子数}，不存在的标签帖子数是0"""
+        found = {}
+        since = time.time() - self.ttl
+        for name in names:
+            row = self._conn.execute(
+                "SELECT post_count FROM tags WHERE name = ? AND fetched_at > ?", (name, since)
+            ).fetchone()
+            if row:
+                found[name] = row[0]
+        return found
+
+    def put_tags(self, records):
+        """records: [(标签名, 帖子数, 类别)]，类别为None表示标签不存在"""
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO tags (name, post_count, category, fetched_at) VALUES (?, ?, ?, ?)",
+            [(name, count, category, now) for name, count, category in records]
+        )
+        self._conn.commit()
+
+    def get_search(self, search):
+        row = self._conn.execute(
+            "SELECT post_count FROM searches WHERE search = ? AND fetched_at > ?", (search, time.time() - self.ttl)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_search(self, search, post_count):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO searches (search, post_count, fetched_at) VALUES (?, ?, ?)",
+            (search, post_count, time.time())
+        )
+        self._conn.commit()
+
+def assess_line(line, tag_counts, search_count, max_images, oversized=DEFAULT_OVERSIZED):
+    """
+    根据标签帖子数和整行的帖子数判断一行的情况，返回:
+    {'count': 帖子数(估算时是上限), 'exact': 是否精确, 'unknown': 不存在的标签, 'yield': 预计能下载的数量, 'flags': [...]}
+    """
+    tags, exact = split_line(line)
+    unknown = [tag for tag in tags if not tag_counts.get(tag)]
+    if search_count is not None:
+        count, exact = search_count, True
+        if count:
+            # tags.json 查不到但整行有结果，是标签别名
+            unknown = []
+    elif tags:
+        # 多个标签同时满足的帖子数不会超过其中最少的那个
+        count = min(tag_counts.get(tag, 0) for tag in tags)
+    else:
+        count, exact = None, False
+    flags = []
+    if unknown:
+        flags.append('unknown_tags')
+    if count == 0:
+        flags.append('empty')
+    if count is not None and count > oversized:
+        flags.append('oversized')
+    expected = max_images if count is None else min(count, max_images)
+    return {'count': count, 'exact': exact, 'unknown': unknown, 'yield': expected, 'flags': flags}
+
+def rank_lines(numbered_lines, results):
+    """按预计产出从高到低排，相同时帖子少的(翻页快的)在前，其余保持原顺序"""
+    def key(pair):
+        result = results[pair[1]]
+        count = result['count'] if result['count'] is not None else float('inf')
+        return (-result['yield'], count)
+    return sorted(numbered_lines, key=key)
+
+def print_preflight(numbered_lines, results, max_images):
+    print(f"\n标签预检 (每行最多 {max_images} 个):")
+    notes = {'unknown_tags': '标签不存在(拼写错误?)', 'empty': '没有帖子', 'oversized': '帖子过多，翻页可能很慢'}
+    for line_number, line in numbered_lines:
+        result = results[line]
+        if result['count'] is None:
+            count = '未知'
+        else:
+            count = f"{result['count']}" if result['exact'] else f"≤{result['count']}"
+        note = ', '.join(notes[flag] for flag in result['flags'])
+        if result['unknown']:
+            note += f" ({' '.join(result['unknown'])})"
+        print(f"  第{line_number}行 {line}: 帖子 {count}, 预计下载 {result['yield']}" + (f"  [{note}]" if note else ''))
+    empty = sum(1 for _, line in numbered_lines if 'empty' in results[line]['flags'])
+    total = sum(results[line]['yield'] for _, line in numbered_lines)
+    print(f"合计: {len(numbered_lines)} 行, 没有结果 {empty} 行, 预计下载 {total} 个")
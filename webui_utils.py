@@ -1,11 +1,12 @@
 import os
+import contextlib
 import streamlit as st
 import shutil
 import glob
 from pathlib import Path
 from PIL import Image
-import imagehash
 from collections import defaultdict
+from phash_dedup import group_similar_hashes, hash_images, PhashCache
 import random
 import tkinter as tk
 from tkinter import filedialog
@@ -255,13 +256,6 @@ def delete_unmatched_txt_files_func(folder_path):
     
     return deleted_count, logs
 
-def get_image_phash(image_path):
-    try:
-        with Image.open(image_path) as img:
-            return imagehash.phash(img)
-    except Exception as e:
-        return None
-
 def get_image_resolution(image_path):
     try:
         with Image.open(image_path) as img:
@@ -269,12 +263,17 @@ def get_image_resolution(image_path):
     except Exception as e:
         return 0
 
-def find_duplicate_images(directory, threshold=5):
+def find_duplicate_images(directory, threshold=5, workers=None, progress=None, use_cache=True, hash_size=8,
+                          resolutions=None):
     """
     查找重复图片 (来自 hash_to_delete.py)
+    progress(已完成数, 总数): 计算哈希的进度回调
+    use_cache: 哈希缓存在文件夹里的 .phash_cache.sqlite，重新扫描时只算新增和改过的图片
+    hash_size: 8 为64位哈希，16 为256位(更精细，阈值也要相应放大)
+    resolutions: 传入字典时填上每张图的像素数，交给 process_duplicate_groups 就不用再打开图片
     """
     image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff'}
-    image_hashes = {}
+    image_paths = []
     
     if not os.path.exists(directory):
         return []
@@ -284,35 +283,17 @@ def find_duplicate_images(directory, threshold=5):
         ext = os.path.splitext(filename)[1].lower()
         
         if ext in image_extensions and os.path.isfile(file_path):
-            phash = get_image_phash(file_path)
-            if phash:
-                image_hashes[file_path] = phash
-    
-    groups = []
-    processed = set()
+            image_paths.append(file_path)
+
+    with PhashCache(directory, hash_size) if use_cache else contextlib.nullcontext() as cache:
+        image_hashes = dict(hash_images(image_paths, workers=workers, progress=progress, cache=cache,
+                                        hash_size=hash_size, resolutions=resolutions))
+        if cache is not None:
+            cache.prune(image_paths)
     
-    keys = list(image_hashes.keys())
-    for i, path1 in enumerate(keys):
-        if path1 in processed:
-            continue
-        
-        hash1 = image_hashes[path1]
-        group = [path1]
-        processed.add(path1)
-        
-        for path2 in keys[i+1:]:
-            if path2 not in processed:
-                hash2 = image_hashes[path2]
-                if hash1 - hash2 <= threshold:
-                    group.append(path2)
-                    processed.add(path2)
-        
-        if len(group) > 1:
-            groups.append(group)
-            
-    return groups
+    return group_similar_hashes(image_hashes, threshold)
 
-def process_duplicate_groups(groups, method, delete_txt=False):
+def process_duplicate_groups(groups, method, delete_txt=False, resolutions=None):
     """
     处理重复图片组
     method: 'manual' (仅返回列表供展示), 'auto_no_txt' (自动删除无txt的), 'auto_all' (自动删除)
@@ -326,7 +307,10 @@ def process_duplicate_groups(groups, method, delete_txt=False):
         for file_path in group:
             txt_path = os.path.splitext(file_path)[0] + '.txt'
             has_txt = os.path.exists(txt_path)
-            res = get_image_resolution(file_path)
+            if resolutions and file_path in resolutions:
+                res = resolutions[file_path]
+            else:
+                res = get_image_resolution(file_path)
             details.append({
                 'path': file_path,
                 'has_txt': has_txt,